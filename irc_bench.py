@@ -0,0 +1,334 @@
+import argparse
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+
+from irc_dcc import DCCManager
+from irc_transport import AddressCache, open_connection
+from irc_client import HeadlessGui, IRCClient, ProcessIRCClient
+import test_irc_server
+from test_irc_server import TestIRCServer
+
+
+def _quiet_server():
+    # The test server prints every line it receives; keep benchmark output readable
+    test_irc_server.print = lambda *a, **k: None
+    server = TestIRCServer(port=0)
+    server.start_background()
+    return server
+
+
+def bench_dcc(args):
+    # Two DCC managers wired back to back; CTCP goes straight across, data over loopback
+    size = args.size * 1048576
+    tmp = tempfile.mkdtemp(prefix="dccbench")
+    src = os.path.join(tmp, "payload.bin")
+    dst = os.path.join(tmp, "received.bin")
+    with open(src, "wb") as f:
+        block = os.urandom(1048576)
+        for _ in range(args.size):
+            f.write(block)
+
+    for passive in (False, True):
+        done = threading.Event()
+        result = {}
+
+        def on_update(t):
+            if t.direction == "receive" and t.state in ("done", "failed"):
+                result["transfer"] = t
+                done.set()
+
+        sender = DCCManager(lambda line: receiver.handle_ctcp("sender", line.split(" :", 1)[1]),
+                            lambda: "127.0.0.1")
+        receiver = DCCManager(lambda line: sender.handle_ctcp("receiver", line.split(" :", 1)[1]),
+                              lambda: "127.0.0.1", on_update=on_update,
+                              on_offer=lambda t: receiver.accept(t, dst))
+        start = time.perf_counter()
+        sender.offer("receiver", src, passive=passive)
+        if not done.wait(600):
+            print("timed out")
+            return
+        elapsed = time.perf_counter() - start
+        t = result["transfer"]
+        mode = "passive" if passive else "active"
+        if t.state != "done":
+            print(f"{mode}: failed ({t.error})")
+            continue
+        print(f"{mode}: {args.size} MB in {elapsed:.3f}s = {args.size / elapsed:.1f} MB/s")
+        os.remove(dst)
+    os.remove(src)
+    os.rmdir(tmp)
+
+
+def _latency_proxy(host, port, rtt):
+    # Forwards one connection to host:port, holding every chunk back rtt/2 in each
+    # direction; loopback alone has no round trip worth saving
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def pump(src, dst):
+        pending = queue.Queue()
+        def deliver():
+            while True:
+                due, data = pending.get()
+                if data is None:
+                    dst.close()
+                    return
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                try:
+                    dst.sendall(data)
+                except OSError:
+                    return
+        threading.Thread(target=deliver, daemon=True).start()
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                pending.put((time.monotonic() + rtt / 2, data))
+        except OSError:
+            pass
+        pending.put((0, None))
+
+    def serve():
+        client, _ = listener.accept()
+        listener.close()
+        upstream = socket.create_connection((host, port))
+        for sock in (client, upstream):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=pump, args=(client, upstream), daemon=True).start()
+        pump(upstream, client)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def bench_join(args):
+    channels = [f"#bench{i}" for i in range(args.channels)]
+    rtt = args.rtt_ms / 1000
+
+    # Baseline: separate NICK/USER writes, then one JOIN per round trip as the
+    # connect dialog and room search used to do
+    server = _quiet_server()
+    sock = socket.create_connection(("127.0.0.1", _latency_proxy(server.host, server.port, rtt)))
+    start = time.perf_counter()
+    sock.send(b"NICK seq\r\n")
+    sock.send(b"USER seq 0 * :seq\r\n")
+    buf = b""
+    def wait_for(token):
+        nonlocal buf
+        while token not in buf:
+            buf += sock.recv(65536)
+        buf = buf[buf.index(token) + len(token):]
+    wait_for(b" 001 ")
+    for ch in channels:
+        sock.send(f"JOIN {ch}\r\n".encode())
+        wait_for(f" 366 seq {ch} ".encode())
+    sequential = time.perf_counter() - start
+    sock.close()
+    server.running = False
+    print(f"sequential: {args.channels} channels joined in {sequential * 1000:.1f} ms "
+          f"at {args.rtt_ms:g} ms RTT")
+
+    # Pipelined registration with joins queued until 001 and packed into JOIN lists
+    server = _quiet_server()
+    remaining = set(channels)
+    done = threading.Event()
+    def on_message(line):
+        parts = line.split()
+        if len(parts) >= 3 and parts[1] == "JOIN" and parts[0].startswith(":batch!"):
+            remaining.discard(parts[2].lstrip(":"))
+            if not remaining:
+                done.set()
+    client = IRCClient("127.0.0.1", _latency_proxy(server.host, server.port, rtt), "batch", None,
+                       HeadlessGui(on_message))
+    client.log_file = os.devnull
+    client.auto_reconnect = False
+    start = time.perf_counter()
+    client.join_many((ch, None) for ch in channels)
+    client.connect()
+    if not done.wait(60):
+        print(f"batched: timed out with {len(remaining)} channels outstanding")
+        return
+    batched = time.perf_counter() - start
+    client.sock.close()
+    server.running = False
+    print(f"batched: {args.channels} channels joined in {batched * 1000:.1f} ms "
+          f"({sequential / batched:.1f}x faster)")
+
+
+def _flood_server(lines, rate):
+    # Accepts one client, welcomes it and sends `lines` channel messages at `rate`
+    # lines/s (0: as fast as possible); PINGs are answered so lag stays measurable
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        conn, _ = listener.accept()
+        listener.close()
+        conn.sendall(b":bench 001 flood :Welcome\r\n")
+        def answer_pings():
+            buf = b""
+            try:
+                while True:
+                    data = conn.recv(4096)
+                    if not data:
+                        return
+                    *got, buf = (buf + data).split(b"\n")
+                    for line in got:
+                        if line.startswith(b"PING "):
+                            conn.sendall(b"PONG bench " + line[5:].rstrip(b"\r") + b"\r\n")
+            except OSError:
+                pass
+        threading.Thread(target=answer_pings, daemon=True).start()
+        chunk = 100
+        start = time.perf_counter()
+        try:
+            for i in range(0, lines, chunk):
+                conn.sendall(b"".join(
+                    b":nick%d!u@h PRIVMSG #flood :message #%d with some ordinary chat text in it\r\n" % (n % 50, n)
+                    for n in range(i, min(lines, i + chunk))))
+                if rate:
+                    delay = start + (i + chunk) / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+            time.sleep(60)
+        except OSError:
+            pass
+        conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def bench_ipc(args):
+    # No display here, so the UI thread is simulated: every 16 ms it does a fixed
+    # slice of Python work, and we measure how late each frame starts
+    for client_class in (IRCClient, ProcessIRCClient):
+        port = _flood_server(args.lines, args.rate)
+        handled = [0]
+        done = threading.Event()
+        def on_message(line):
+            handled[0] += 1
+            if handled[0] >= args.lines:
+                done.set()
+        client = client_class("127.0.0.1", port, "flood", None, HeadlessGui(on_message))
+        client.log_file = os.devnull
+        client.auto_reconnect = False
+        client.connect()
+        frame = 0.016
+        lateness = []
+        start = time.perf_counter()
+        next_frame = start + frame
+        while not done.is_set() and time.perf_counter() - start < args.timeout:
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            lateness.append(max(0.0, time.perf_counter() - next_frame))
+            sum(i * i for i in range(args.work))
+            next_frame += frame
+        elapsed = time.perf_counter() - start
+        client.auto_reconnect = False
+        client.sock.close()
+        lateness.sort()
+        def pct(p):
+            return lateness[min(len(lateness) - 1, int(len(lateness) * p))] * 1000
+        name = "network process" if client_class is ProcessIRCClient else "in-process"
+        print(f"{name}: {handled[0]}/{args.lines} lines in {elapsed:.2f}s, {len(lateness)} frames, "
+              f"frame lateness p50 {pct(0.5):.2f} ms, p99 {pct(0.99):.2f} ms, max {pct(1.0):.2f} ms")
+
+
+def _blackhole():
+    # A listener whose accept queue is full: further SYNs are dropped, so
+    # connecting to it hangs like an unreachable server address would
+    listener = socket.socket()
+    listener.bind(("127.0.0.2", 0))
+    listener.listen(0)
+    filler = socket.create_connection(listener.getsockname())
+    return listener, filler
+
+
+def bench_connect(args):
+    dead, filler = _blackhole()
+    live = socket.create_server(("127.0.0.1", 0), backlog=128)
+    stop = threading.Event()
+    def accept_loop():
+        while not stop.is_set():
+            conn, _ = live.accept()
+            conn.close()
+    threading.Thread(target=accept_loop, daemon=True).start()
+    # The stand-in name resolves to the dead address first, as a stale or
+    # broken record would, and every lookup costs --dns-ms
+    records = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", dead.getsockname()),
+               (socket.AF_INET, socket.SOCK_STREAM, 6, "", live.getsockname())]
+    def resolver(host, port, *rest):
+        time.sleep(args.dns_ms / 1000)
+        return records
+
+    def median(values):
+        return sorted(values)[len(values) // 2] * 1000
+
+    # Baseline: resolve on every attempt, then try each address in turn with a
+    # blocking connect, as socket.create_connection() does
+    times = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        for family, _, _, _, sockaddr in resolver("irc.example", 6667):
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(args.timeout)
+            try:
+                sock.connect(sockaddr)
+                break
+            except OSError:
+                sock.close()
+        times.append(time.perf_counter() - start)
+        sock.close()
+    sequential = median(times)
+    print(f"sequential, {args.timeout:g} s per address: median {sequential:.1f} ms over {args.rounds} connects")
+
+    cache = AddressCache(resolver=resolver)
+    times = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        sock = open_connection("irc.example", 6667, cache=cache, delay=args.delay_ms / 1000)
+        times.append(time.perf_counter() - start)
+        sock.close()
+    print(f"racing, {args.delay_ms:g} ms stagger: first {times[0] * 1000:.1f} ms "
+          f"({sequential / (times[0] * 1000):.0f}x faster), then median {median(times[1:] or times):.1f} ms "
+          f"from the cached, reordered addresses ({cache.lookups} DNS lookup in {args.rounds} connects)")
+    stop.set()
+    filler.close()
+    dead.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IRC client micro-benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p = sub.add_parser("dcc", help="loopback DCC SEND throughput")
+    p.add_argument("--size", type=int, default=256, help="payload size in MB")
+    p.set_defaults(func=bench_dcc)
+    p = sub.add_parser("join", help="time until N channels are joined on the local test server")
+    p.add_argument("--channels", type=int, default=200)
+    p.add_argument("--rtt-ms", type=float, default=20.0, help="round trip added by a local delaying proxy")
+    p.set_defaults(func=bench_join)
+    p = sub.add_parser("ipc", help="UI frame lateness while a flooded connection is being read")
+    p.add_argument("--lines", type=int, default=200000)
+    p.add_argument("--rate", type=int, default=0, help="lines/s from the server, 0 for unthrottled")
+    p.add_argument("--work", type=int, default=20000, help="size of the per-frame work loop")
+    p.add_argument("--timeout", type=float, default=60.0)
+    p.set_defaults(func=bench_ipc)
+    p = sub.add_parser("connect", help="connect latency when the first resolved address is unresponsive")
+    p.add_argument("--rounds", type=int, default=5)
+    p.add_argument("--timeout", type=float, default=3.0, help="per-address timeout of the sequential baseline")
+    p.add_argument("--delay-ms", type=float, default=250.0, help="stagger between racing attempts")
+    p.add_argument("--dns-ms", type=float, default=50.0, help="simulated resolver latency")
+    p.set_defaults(func=bench_connect)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
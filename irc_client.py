@@ -1,72 +1,409 @@
-import socket
+import select
 import threading
 import tkinter as tk
 from tkinter import scrolledtext, simpledialog, messagebox
 from tkinter import ttk
+from tkinter import filedialog
 import os, json
 import datetime
+import time
+import multiprocessing
+from collections import deque
 
+from irc_dcc import DCCManager, format_size
+from irc_notify import NotificationService, build_backends
+from irc_plugins import Event, PluginManager, event_from_line
+from irc_protocol import parse_message
+from irc_userinfo import USERINFO_NUMERICS, UserInfoCache, irc_casefold
+from irc_replay import INBOUND, RecordingSocket, TrafficRecorder
+from irc_transport import DNS_CACHE, open_connection
+from irc_overload import OverloadGuard, StormBatch
+from irc_diagnostics import Diagnostics, install_signal_handlers
+from irc_netproc import (CHANNELS, CONNECTED, DCC, DISCONNECTED, LAG, LINE, NAMES, NICKNAME, NOTICE, RAW,
+                         REGISTERED, SEEN, STORM, USERINFO, PipeSocket, RemoteUserInfo, run_network,
+                         unpack_records)
 
 
-try:
-    import winsound
-except ImportError:
-    winsound = None
+class ChannelTab:
+    # Messages live in a bounded line store; the Text widget only exists while the tab is awake
+    def __init__(self, name, frame, scrollback):
+        self.name = name
+        self.frame = frame
+        self.text = None
+        self.lines = deque(maxlen=scrollback)
+        self.unread = 0
+        self.last_viewed = time.monotonic()
+
+MAX_LINE_BYTES = 512
+
+def build_join_lines(channels, limit=MAX_LINE_BYTES):
+    # Pack (channel, key) pairs into "JOIN #a,#b k1" lines that fit the IRC line limit.
+    # Keys are matched to channels by position, so keyed channels go first on each line.
+    ordered = [c for c in channels if c[1]] + [c for c in channels if not c[1]]
+    lines = []
+    chans, keys = [], []
+    for channel, key in ordered:
+        new_chans = chans + [channel]
+        new_keys = keys + [key] if key else keys
+        if chans and len(_join_line(new_chans, new_keys).encode('utf-8')) + 2 > limit:
+            lines.append(_join_line(chans, keys))
+            new_chans, new_keys = [channel], [key] if key else []
+        chans, keys = new_chans, new_keys
+    if chans:
+        lines.append(_join_line(chans, keys))
+    return lines
+
+def _join_line(chans, keys):
+    line = "JOIN " + ",".join(chans)
+    if keys:
+        line += " " + ",".join(keys)
+    return line
+
+def _lag_pong_sent(line):
+    # Send time (time.monotonic) of the lag PING a PONG answers, else None.
+    # Some servers answer without a prefix: "PONG :LAG<ns>"
+    if 'PONG' not in line[:64]:
+        return None
+    msg = parse_message(line)
+    if msg.command != 'PONG' or not msg.text.startswith('LAG'):
+        return None
+    try:
+        return int(msg.text[3:]) / 1e9
+    except ValueError:
+        return None
+
+SETTINGS_FILE = os.path.join(os.path.dirname(__file__), "client_settings.json")
+PLUGIN_DIR = os.path.join(os.path.dirname(__file__), "plugins")
+DEFAULT_SETTINGS = {
+    "nickname": "",
+    "server": "",
+    "port": 6667,
+    "channel": "",
+    "notify_backends": ["auto"],  # terminal_bell, tk_bell, beep, desktop, sound
+    "notify_sound_file": "",
+    "ping_interval": 10,
+    "read_timeout": 25,
+    "network_process": False,  # run socket I/O in a separate process
+    "overload_rate": 150,  # inbound lines/s that switch on join/part/quit summaries
+    "overload_interval": 2.0
+}
+
+def load_settings(path=SETTINGS_FILE):
+    # Saved client settings over the defaults, for front ends without IRCGui
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                settings.update(json.load(f).get("settings", {}))
+        except Exception as e:
+            print(f"Settings load error: {e}")
+    return settings
+
+class HeadlessGui:
+    # Stands in for IRCGui when IRCClient runs without Tk (benchmarks, replay)
+    def __init__(self, on_message=None, settings=None, plugins=None):
+        self.client = None
+        self.on_message = on_message or (lambda message: None)
+        self.settings = settings or dict(DEFAULT_SETTINGS)
+        self.plugins = plugins or PluginManager()
+
+    def _new_client(self, server, port, nickname, channel, client_class=None):
+        return new_client(self.settings, self, server, port, nickname, channel,
+                          plugins=self.plugins, client_class=client_class)
+
+    def append_message(self, message):
+        self.on_message(message)
+
+    def dcc_updated(self, transfer):
+        pass
+
+    def dcc_offer(self, transfer):
+        pass
+
+    def lag_updated(self, seconds, pending=False):
+        pass
+
+    def names_updated(self, channel, users):
+        pass
+
+    def membership_changed(self, batch):
+        pass
+
+    def overload_message(self, text):
+        self.on_message(text)
+
+    def channel_list(self, channels):
+        pass
 
 class IRCClient:
-    def __init__(self, server, port, nickname, channel, gui):
+    def __init__(self, server, port, nickname, channel, gui, password=None, plugins=None):
         self.server = server
         self.port = port
         self.nickname = nickname
         self.channel = channel
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.password = password
+        self.caps = []  # IRCv3 capabilities to request during registration
+        self.registered = False
+        self.pending_joins = []  # (channel, key) waiting for 001
+        self.channel_keys = {}  # case-folded channel -> (channel, key), rejoined on reconnect
+        self._join_lock = threading.Lock()
+        self._listing = None  # channel names from 322 while a LIST is running
+        self._last_line = None
+        self.recorder = None
+        self.ping_interval = 10  # seconds between lag PINGs
+        self.read_timeout = 25  # no data at all for this long means the link is dead
+        self.connect_delay = 0.25  # head start of each address over the next when racing
+        self.connect_timeout = 30
+        self.lag = None
+        self.generation = 0  # bumped per connect(); listen loops of older connections exit quietly
+        self.plugins = plugins or PluginManager()
+        self.plugins.client = self
+        self.sock = None  # set by connect()
         self.gui = gui
         self.gui.client = self  # Reference to this client in the GUI
         self.log_file = os.path.join(os.path.dirname(__file__), "chat_log.txt")
         self.auto_reconnect = True  # New feature: auto-reconnect toggle
+        self.userinfo = UserInfoCache(self.send_raw)
+        self.overload = OverloadGuard(self._flush_storm, on_notice=gui.overload_message)
+        self.dcc = DCCManager(self.send_raw, self._local_ip,
+                              on_update=gui.dcc_updated, on_offer=gui.dcc_offer,
+                              on_message=gui.append_message)
+    def _local_ip(self):
+        if self.sock is None:
+            raise OSError("not connected")
+        return self.sock.getsockname()[0]
+
+    def registration_lines(self):
+        # CAP END is pipelined too: nothing here needs the server's CAP LS reply first
+        lines = ["CAP LS 302"]
+        if self.password:
+            lines.append(f"PASS {self.password}")
+        lines.append(f"NICK {self.nickname}")
+        lines.append(f"USER {self.nickname} 0 * :{self.nickname}")
+        if self.caps:
+            lines.append(f"CAP REQ :{' '.join(self.caps)}")
+        lines.append("CAP END")
+        return lines
+
     def connect(self):
         try:
-            self.sock.connect((self.server, self.port))
-            self.sock.send(f"NICK {self.nickname}\r\n".encode('utf-8'))
-            self.sock.send(f"USER {self.nickname} 0 * :{self.nickname}\r\n".encode('utf-8'))
-            threading.Thread(target=self.listen, daemon=True).start()
+            self.registered = False
+            self.generation += 1
+            if self.sock is not None:
+                # A manual reconnect replaces a live connection; its listen loop
+                # sees the new generation and exits without reconnecting
+                old, self.sock = self.sock, None
+                try:
+                    old.close()
+                except Exception:
+                    pass
+            sock = open_connection(self.server, self.port, delay=self.connect_delay, timeout=self.connect_timeout)
+            self.sock = RecordingSocket(sock, self.recorder) if self.recorder else sock
+            self.sock.sendall(''.join(f"{line}\r\n" for line in self.registration_lines()).encode('utf-8'))
+            threading.Thread(target=self.listen, args=(self.sock, self.generation), daemon=True).start()
+            self.plugins.dispatch(Event("connect", client=self))
         except Exception as e:
             self.gui.append_message(f"Connection error: {e}")
 
     def reconnect(self):
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            with self._join_lock:
+                self.pending_joins = list(self.channel_keys.values())
             self.connect()
             self.gui.append_message("Reconnected to server.")
         except Exception as e:
             self.gui.append_message(f"Reconnect error: {e}")
 
-    def listen(self):
-        last_line = None
-        while True:
+    def join(self, channel, key=None):
+        self.join_many([(channel, key)])
+
+    def join_many(self, channels):
+        # Queued together so they go out in as few JOIN lines as possible;
+        # before registration they wait for 001
+        with self._join_lock:
+            for channel, key in channels:
+                self.channel_keys[irc_casefold(channel)] = (channel, key)
+                self.pending_joins.append((channel, key))
+        if self.registered:
+            self._flush_joins()
+
+    def _flush_joins(self):
+        with self._join_lock:
+            pending, self.pending_joins = self.pending_joins, []
+        if not pending:
+            return
+        try:
+            self.sock.sendall(''.join(f"{line}\r\n" for line in build_join_lines(pending)).encode('utf-8'))
+        except Exception as e:
+            self.gui.append_message(f"Join error: {e}")
+
+    def listen(self, sock, generation):
+        # Keepalive state is this loop's own, so a replaced connection cannot
+        # touch the lag or read deadline of the one that replaced it
+        buffer = b""
+        last_recv = time.monotonic()
+        next_ping = last_recv + self.ping_interval
+        ping_sent = None
+        while generation == self.generation:
             try:
-                resp = self.sock.recv(2048).decode('utf-8', errors='ignore')
-                for line in resp.split('\r\n'):
-                    if line:
-                        # Do not post NAMES (user list) responses to chat
-                        if (' 353 ' in line or ' 366 ' in line):
-                            continue
-                        # Only post to main chat if not a LIST response (322/323)
-                        if not (' 322 ' in line or ' 323 ' in line):
-                            # Filter out repeated lines
-                            if line != last_line:
-                                self.gui.append_message(line)
-                                self._log_message(line)
-                                last_line = line
-                    if line.startswith('PING'):
-                        self.sock.send(f"PONG {line.split()[1]}\r\n".encode('utf-8'))
+                # Wake up for the next lag PING or the inactivity deadline, whichever is first
+                now = time.monotonic()
+                deadline = last_recv + self.read_timeout
+                if now >= deadline:
+                    raise ConnectionError(f"no data from server for {self.read_timeout} s")
+                if now >= next_ping:
+                    # The token carries its own send time, so no per-PING state is needed for RTT
+                    sock.send(f"PING :LAG{time.monotonic_ns()}\r\n".encode('utf-8'))
+                    if ping_sent is None:
+                        ping_sent = now
+                    next_ping = now + self.ping_interval
+                if ping_sent and now - ping_sent > (self.lag or 0) + 1:
+                    # Show lag growing while a PONG is overdue
+                    self.gui.lag_updated(now - ping_sent, pending=True)
+                # select() rather than a socket timeout: other threads send on this
+                # socket, and a timeout would apply to their sendall() too
+                readable, _, _ = select.select([sock], [], [], max(0.05, min(next_ping, deadline, now + 1) - now))
+                if not readable:
+                    continue
+                data = sock.recv(4096)
+                if not data:
+                    raise ConnectionError("connection closed by server")
+                last_recv = time.monotonic()
+                # Keep any partial line until the rest of it arrives
+                *lines, buffer = (buffer + data).split(b'\n')
+                for raw in lines:
+                    raw = raw.rstrip(b'\r')
+                    if self.recorder:
+                        self.recorder.write(INBOUND, raw)
+                    line = raw.decode('utf-8', errors='ignore')
+                    if line.startswith('PING '):
+                        # Echo the token back as sent, including a ':' trailing marker
+                        sock.send(f"PONG {line[5:]}\r\n".encode('utf-8'))
+                        continue
+                    sent = _lag_pong_sent(line)
+                    if sent is not None:
+                        self.lag = time.monotonic() - sent
+                        ping_sent = None
+                        self.gui.lag_updated(self.lag)
+                        continue
+                    self._handle_line(line)
             except Exception as e:
+                try:
+                    sock.close()
+                except Exception:
+                    pass
+                if generation != self.generation:
+                    # Replaced by a newer connect(); that one owns reconnecting
+                    break
+                self.userinfo.reset()
                 self.gui.append_message(f"Disconnected: {e}")
+                self.plugins.dispatch(Event("disconnect", client=self, error=str(e)))
                 if self.auto_reconnect:
                     self.gui.append_message("Attempting auto-reconnect...")
                     threading.Thread(target=self.reconnect, daemon=True).start()
                 break
 
+    def _handle_line(self, line):
+        # Parse, route and render one inbound line; shared by listen() and replay
+        if not line:
+            return
+        if line.startswith('PING ') or _lag_pong_sent(line) is not None:
+            # Keepalive traffic is answered where it is read (listen or the
+            # network process); a replayed recording has nothing to answer
+            return
+        command = line.split(' ', 2)[1:2]
+        command = command[0] if command else ''
+        if command == '001':
+            self.registered = True
+            self._flush_joins()
+        # Client state is updated before plugins run, so a filter hiding a
+        # line cannot leave the user info cache waiting for a reply
+        consumed = False
+        if command in USERINFO_NUMERICS:
+            # WHOIS/WHO replies fill the user info cache instead of the chat
+            consumed = self.userinfo.handle(parse_message(line))
+        elif command == 'NICK':
+            msg = parse_message(line)
+            if msg.nick == self.nickname:
+                self.nickname = msg.text
+            self.userinfo.handle_nick(msg.nick or '', msg.text)
+        elif command == 'QUIT':
+            self.userinfo.handle_quit(line.split('!')[0][1:])
+        elif command in ('322', '323'):
+            # LIST replies fill Room Search, never the chat
+            self._collect_list(command, line)
+            consumed = True
+        if not self._run_plugins(line) or consumed:
+            return
+        # DCC negotiation travels as CTCP inside PRIVMSG
+        if ' PRIVMSG ' in line and '\x01DCC ' in line:
+            msg = parse_message(line)
+            # An offer sent to a channel is not meant for us alone; ignore it
+            if irc_casefold(msg.target or '') == irc_casefold(self.nickname):
+                self.dcc.handle_ctcp(msg.nick or '', msg.text)
+            return
+        # Do not post NAMES (user list) responses to chat
+        if (' 353 ' in line or ' 366 ' in line):
+            return
+        # Join/part/quit/mode storms are summarised once per interval instead
+        if self.overload.absorb(line, command, self.nickname):
+            return
+        # Only post to main chat if not a LIST response (322/323)
+        if not (' 322 ' in line or ' 323 ' in line):
+            # Filter out repeated lines
+            if line != self._last_line:
+                self.gui.append_message(line)
+                self._log_message(line)
+                self._last_line = line
+
+    def _run_plugins(self, line):
+        # Filters run inline and may hide the line from chat and log (False);
+        # handlers still see every event
+        if not self.plugins.active:
+            return True
+        event = event_from_line(line, client=self)
+        keep = self.plugins.run_filters(event)
+        self.plugins.dispatch(event)
+        return keep
+
+    def request_list(self):
+        # The gui gets channel_list(names) once the server's 323 arrives
+        with self._join_lock:
+            self._listing = []
+        self.send_raw("LIST")
+
+    def _collect_list(self, command, line):
+        with self._join_lock:
+            if self._listing is None:
+                return
+            if command == '322':
+                params = parse_message(line).params
+                if len(params) >= 2:
+                    self._listing.append(params[1])
+                return
+            channels, self._listing = self._listing, None
+        self.gui.channel_list(sorted(set(channels), key=irc_casefold))
+
+    def _flush_storm(self, batch):
+        for line in batch.summary():
+            self.gui.overload_message(line)
+            self._log_message(line)
+        self.gui.membership_changed(batch)
+
+    def start_recording(self, path):
+        self.stop_recording()
+        self.recorder = TrafficRecorder(path, {"server": self.server, "port": self.port,
+                                               "nickname": self.nickname})
+        if self.sock is not None:
+            self.sock = RecordingSocket(self.sock, self.recorder)
+
+    def stop_recording(self):
+        if self.recorder:
+            recorder, self.recorder = self.recorder, None
+            if isinstance(self.sock, RecordingSocket):
+                self.sock = self.sock.sock
+            recorder.close()
+
     def _log_message(self, message):
         try:
             with open(self.log_file, "a", encoding="utf-8") as f:
@@ -74,12 +411,217 @@ class IRCClient:
         except Exception:
             pass
 
+    def send_raw(self, line):
+        if self.sock is None:
+            raise OSError("not connected")
+        self.sock.send(f"{line}\r\n".encode('utf-8'))
+
     def send_message(self, message):
         try:
-            self.sock.send(f"PRIVMSG {self.channel} :{message}\r\n".encode('utf-8'))
+            self.send_raw(f"PRIVMSG {self.channel} :{message}")
         except Exception as e:
             self.gui.append_message(f"Send error: {e}")
 
+class ProcessIRCClient(IRCClient):
+    # Socket reads, parsing and classification, the user info cache, overload
+    # summaries and the chat log live in a separate process (irc_netproc); this
+    # process runs plugins, DCC and the GUI on the records it sends over
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.userinfo = RemoteUserInfo()
+        self.process = None
+        self.reconnect_delay = 1.0  # doubles on each quick disconnect, up to max_reconnect_delay
+        self.max_reconnect_delay = 60.0
+        self._reconnecting = False
+
+    def connect(self):
+        try:
+            self.registered = False
+            self.generation += 1
+            self._stop_process()
+            parent_conn, child_conn = multiprocessing.Pipe()
+            config = {"server": self.server, "port": self.port,
+                      # Resolved here so the DNS cache outlives network processes
+                      "addresses": DNS_CACHE.resolve(self.server, self.port),
+                      "connect_delay": self.connect_delay, "connect_timeout": self.connect_timeout,
+                      "registration": self.registration_lines(),
+                      "ping_interval": self.ping_interval, "read_timeout": self.read_timeout,
+                      "recording": self.recorder is not None,
+                      # Plugins see every line, so nothing may be dropped before them
+                      "forward_all": self.plugins.active,
+                      # Filters decide in this process what reaches the chat and the log
+                      "filters": bool(self.plugins.filters), "log_file": self.log_file,
+                      "nickname": self.nickname, "userinfo": self.userinfo.config(),
+                      "overload": (self.overload.enter_rate, self.overload.exit_rate, self.overload.interval)}
+            ctx = multiprocessing.get_context("spawn")
+            self.process = ctx.Process(target=run_network, args=(child_conn, config),
+                                       name="irc-network", daemon=True)
+            self.process.start()
+            child_conn.close()
+            self.sock = PipeSocket(parent_conn)
+            self.userinfo.pipe = self.sock
+            if self.recorder:
+                self.sock = RecordingSocket(self.sock, self.recorder)
+            threading.Thread(target=self.listen, args=(parent_conn, self.generation), daemon=True).start()
+            self.plugins.dispatch(Event("connect", client=self))
+        except Exception as e:
+            self.gui.append_message(f"Connection error: {e}")
+
+    def reconnect(self):
+        # "Reconnected" is reported once the network process has actually connected
+        try:
+            with self._join_lock:
+                self.pending_joins = list(self.channel_keys.values())
+            self._reconnecting = True
+            self.connect()
+        except Exception as e:
+            self.gui.append_message(f"Reconnect error: {e}")
+
+    def _reconnect_later(self, generation, delay):
+        time.sleep(delay)
+        if generation == self.generation and self.auto_reconnect:
+            self.reconnect()
+
+    def _stop_process(self):
+        if self.process is None:
+            return
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process = None
+
+    def listen(self, conn, generation):
+        pipe_sock = self._pipe_sock()
+        reason = "network process exited"
+        connected = None  # time the network process reported its connection
+        try:
+            while generation == self.generation:
+                batch = conn.recv_bytes()
+                for kind, payload in unpack_records(batch):
+                    if kind == LINE:
+                        if self.plugins.filters:
+                            # The network process leaves filtering, repeats and the log to us
+                            if self._run_plugins(payload) and payload != self._last_line:
+                                self.gui.append_message(payload)
+                                self._log_message(payload)
+                                self._last_line = payload
+                        elif self._run_plugins(payload):
+                            self.gui.append_message(payload)
+                    elif kind == SEEN:
+                        self._run_plugins(payload)
+                    elif kind == DCC:
+                        if self._run_plugins(payload):
+                            msg = parse_message(payload)
+                            self.dcc.handle_ctcp(msg.nick or '', msg.text)
+                    elif kind == USERINFO:
+                        self.userinfo.deliver(payload)
+                    elif kind == STORM:
+                        storm = json.loads(payload)
+                        for line in storm["lines"]:
+                            self.gui.overload_message(line)
+                        batch = StormBatch()
+                        batch.events = [tuple(event) for event in storm["events"]]
+                        self.gui.membership_changed(batch)
+                    elif kind == NOTICE:
+                        self.gui.overload_message(payload)
+                    elif kind == REGISTERED:
+                        self.registered = True
+                        self._flush_joins()
+                    elif kind == NICKNAME:
+                        self.nickname = payload
+                    elif kind == CHANNELS:
+                        with self._join_lock:
+                            listing, self._listing = self._listing, None
+                        if listing is not None:
+                            self.gui.channel_list(payload.split())
+                    elif kind == RAW:
+                        if self.recorder:
+                            self.recorder.write(INBOUND, payload.encode('utf-8'))
+                    elif kind == LAG:
+                        seconds, pending = payload.split()
+                        self.lag = float(seconds)
+                        self.gui.lag_updated(self.lag, pending=pending == "1")
+                    elif kind == NAMES:
+                        channel, *users = payload.split()
+                        self.gui.names_updated(channel, users)
+                    elif kind == CONNECTED:
+                        pipe_sock.local_address = (payload, 0)
+                        connected = time.monotonic()
+                        if self._reconnecting:
+                            self._reconnecting = False
+                            self.gui.append_message("Reconnected to server.")
+                    elif kind == DISCONNECTED:
+                        raise ConnectionError(payload)
+        except EOFError:
+            pass
+        except Exception as e:
+            reason = str(e)
+        conn.close()
+        if generation != self.generation:
+            # Replaced by a newer connect(); that one owns reconnecting
+            return
+        self.userinfo.reset()
+        if connected is None:
+            # Never got a connection: report it once, like IRCClient.connect does
+            DNS_CACHE.invalidate(self.server, self.port)
+            self._reconnecting = False
+            self.gui.append_message(f"Connection error: {reason}")
+            return
+        self.gui.append_message(f"Disconnected: {reason}")
+        self.plugins.dispatch(Event("disconnect", client=self, error=reason))
+        if self.auto_reconnect:
+            if time.monotonic() - connected > self.max_reconnect_delay:
+                self.reconnect_delay = 1.0
+            delay = self.reconnect_delay
+            self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+            self.gui.append_message(f"Attempting auto-reconnect in {delay:.0f} s...")
+            threading.Thread(target=self._reconnect_later, args=(generation, delay), daemon=True).start()
+
+    def start_recording(self, path):
+        super().start_recording(path)
+        self._set_recording(True)
+
+    def stop_recording(self):
+        super().stop_recording()
+        self._set_recording(False)
+
+    def _log_message(self, message):
+        # The network process owns the chat log file
+        try:
+            self._pipe_sock().log(message)
+        except Exception:
+            pass
+
+    def _pipe_sock(self):
+        return self.sock.sock if isinstance(self.sock, RecordingSocket) else self.sock
+
+    def _set_recording(self, on):
+        # Inbound lines the network process answers or drops itself are only sent
+        # over while recording; before connect() the config carries the flag instead
+        sock = self._pipe_sock()
+        if isinstance(sock, PipeSocket):
+            try:
+                sock.set_recording(on)
+            except OSError:
+                pass
+
+def new_client(settings, gui, server, port, nickname, channel, plugins=None, client_class=None):
+    # Builds a client configured from user settings; shared by the GUI and replay
+    if client_class is None:
+        client_class = ProcessIRCClient if settings["network_process"] else IRCClient
+    client = client_class(server, port, nickname, channel, gui, plugins=plugins)
+    client.ping_interval = settings["ping_interval"]
+    client.read_timeout = settings["read_timeout"]
+    client.overload.enter_rate = settings["overload_rate"]
+    client.overload.exit_rate = settings["overload_rate"] / 4
+    client.overload.interval = settings["overload_interval"]
+    return client
+
+
 class IRCGui:
     def __init__(self, root):
         self.root = root
@@ -104,14 +646,13 @@ class IRCGui:
         }
         
 
-        self.settings_file = os.path.join(os.path.dirname(__file__), "client_settings.json")
-        self.settings = {
-            "nickname": "",
-            "server": "",
-            "port": 6667,
-            "channel": ""
-        }
+        self.settings_file = SETTINGS_FILE
+        self.settings = dict(DEFAULT_SETTINGS)
         self._load_all_settings()
+        self.plugins = PluginManager(on_error=lambda text: self.root.after(0, self.append_message, text))
+        self.plugins.load_directory(PLUGIN_DIR)
+        self.notifier = NotificationService(build_backends(self.settings["notify_backends"], root=self.root,
+                                                           sound_file=self.settings["notify_sound_file"]))
 
         # Menu setup before any frames/widgets
         self.menu = tk.Menu(self.root)
@@ -123,6 +664,9 @@ class IRCGui:
         self.connection_menu.add_command(label="Reconnect", command=self.reconnect)  # New feature
         self.connection_menu.add_separator()
         self.connection_menu.add_command(label="Room Search", command=self.room_search)
+        self.connection_menu.add_command(label="File Transfers", command=self.show_transfers)
+        self.connection_menu.add_command(label="Record Traffic...", command=self.start_recording)
+        self.connection_menu.add_command(label="Stop Recording", command=self.stop_recording)
         self.connection_menu.add_separator()
         self.connection_menu.add_command(label="Add Bookmark", command=self.add_bookmark)
         self.connection_menu.add_command(label="Select Bookmark", command=self.select_bookmark)
@@ -136,9 +680,31 @@ class IRCGui:
         self.settings_menu = tk.Menu(self.menu, tearoff=0)
         self.menu.add_cascade(label="Settings", menu=self.settings_menu)
         self.settings_menu.add_command(label="Client Settings", command=self.edit_settings)
+        self.settings_menu.add_command(label="Plugin Status", command=self.show_plugin_status)
+        # Diagnostics menu: profile and trace memory without restarting
+        self.diagnostics = Diagnostics()
+        self.diagnostics_menu = tk.Menu(self.menu, tearoff=0)
+        self.menu.add_cascade(label="Diagnostics", menu=self.diagnostics_menu)
+        self.diagnostics_menu.add_command(label="Start/Stop Profiler (all threads)",
+                                          command=lambda: self._run_diagnostics(self.diagnostics.toggle_profile))
+        self.diagnostics_menu.add_command(label="Start/Stop cProfile (GUI thread)",
+                                          command=lambda: self._run_diagnostics(
+                                              lambda: self.diagnostics.toggle_profile("cprofile")))
+        self.diagnostics_menu.add_separator()
+        self.diagnostics_menu.add_command(label="Start/Stop Memory Trace",
+                                          command=lambda: self._run_diagnostics(self.diagnostics.toggle_trace))
+        self.diagnostics_menu.add_command(label="Memory Snapshot",
+                                          command=lambda: self._run_diagnostics(
+                                              lambda: f"Memory snapshot: {self.diagnostics.snapshot()}"))
 
         self.frame = tk.Frame(root)
         self.frame.pack(fill=tk.BOTH, expand=True)
+        self.user_count_label = tk.Label(self.frame, text="Users online: 0")
+        self.user_count_label.pack(side=tk.TOP, anchor=tk.E, padx=15)
+        self.lag_label = tk.Label(self.frame, text="Lag: -")
+        self.lag_label.pack(side=tk.TOP, anchor=tk.E, padx=15)
+        self.hover_label = tk.Label(self.frame, text="")
+        self.hover_label.pack(side=tk.TOP, anchor=tk.E, padx=15)
         # User listbox on the right
         self.user_listbox = tk.Listbox(self.frame, width=35, bg=self.theme_colors[self.theme]["listbox_bg"],
                                        fg=self.theme_colors[self.theme]["listbox_fg"])
@@ -176,18 +742,34 @@ class IRCGui:
         self.user_menu = tk.Menu(self.root, tearoff=0)
         
         self.user_menu.add_command(label="Whois", command=self.whois_selected_user)
+        self.user_menu.add_command(label="Show Hosts", command=self.show_hosts)
+        self.user_menu.add_command(label="Send File...", command=self.send_file_to_selected_user)
+        self.user_menu.add_command(label="Send File (passive)...",
+                                   command=lambda: self.send_file_to_selected_user(passive=True))
         self.user_listbox.bind("<Button-3>", self.show_user_menu)
+        self.user_listbox.bind("<Motion>", self._on_user_hover)
+        self.user_listbox.bind("<Leave>", lambda e: self._set_hover(None))
+        self._hover_nick = None
 
         
 
         self.tab_histories = {}  # <-- Add this line to initialize tab_histories
+        self.channel_tabs = {}  # case-folded channel -> ChannelTab
+        self._current_channel_tab = None
+        self.scrollback_lines = 2000
+        self.max_live_tabs = 8  # channel tabs that keep a Text widget
+        self.hibernate_after = 300  # seconds unviewed before a tab is hibernated
+        self.hibernate_check_interval = 30000
+        self.tabs.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+        self.root.after(self.hibernate_check_interval, self._hibernate_idle_tabs)
+        self.transfers_win = None
         self.auto_update_interval = 10000  # 10 seconds
         self._auto_update_user_list()      # Start auto-update loop
     def _auto_update_user_list(self):
         # Periodically request user list for current channel
         if self.client and self.client.channel:
             try:
-                self.client.sock.send(f"NAMES {self.client.channel}\r\n".encode('utf-8'))
+                self.client.send_raw(f"NAMES {self.client.channel}")
             except Exception:
                 pass
         self.root.after(self.auto_update_interval, self._auto_update_user_list)
@@ -278,9 +860,15 @@ class IRCGui:
             idx = int(selected) - 1
             if 0 <= idx < len(self.bookmarks):
                 b = self.bookmarks[idx]
-                self.client = IRCClient(b["server"], b["port"], b["nickname"], b["channel"], self)
+                channels = self._parse_channel_entry(b["channel"])
+                self.client = self._new_client(b["server"], b["port"], b["nickname"],
+                                               channels[0][0] if channels else None)
                 self.append_message(f"Connecting to {b['server']} on {b['channel']} as {b['nickname']}...")
+                self.client.join_many(channels)
                 self.client.connect()
+                for name, key in channels:
+                    self._open_channel_tab(name, select=(name == self.client.channel))
+                self.entry.config(state='normal')
                 self.last_connection = (b["server"], b["port"], b["nickname"], b["channel"])
                 self._save_all_settings()
             else:
@@ -318,8 +906,9 @@ class IRCGui:
             if sel:
                 channel = self.channel_listbox.get(sel[0])
                 self.client.channel = channel  # Set current channel for main chat
-                self.client.sock.send(f"JOIN {channel}\r\n".encode('utf-8'))
+                self.client.join(channel)
                 self.append_message(f"Joining channel {channel}...")
+                self._open_channel_tab(channel)
                 self.entry.config(state='normal')  # Enable entry after joining channel
                 self.channel_win.destroy()
         join_btn = tk.Button(self.channel_win, text="Join Channel", command=join_selected)
@@ -338,31 +927,14 @@ class IRCGui:
             self.no_channels_label.destroy()
             self.no_channels_label = None
         try:
-            self.client.sock.send(b"LIST\r\n")
-            threading.Thread(target=self._capture_list_response_window, daemon=True).start()
+            # The replies arrive through the client's normal line handling, in
+            # either connection mode; channel_list() is called at 323
+            self.client.request_list()
         except Exception as e:
             self.append_message(f"Error requesting channel list: {e}")
 
-    def _capture_list_response_window(self):
-        import time
-        start = time.time()
-        channels = set()
-        while time.time() - start < 3:
-            try:
-                resp = self.client.sock.recv(4096).decode('utf-8', errors='ignore')
-                for line in resp.split('\r\n'):
-                    # Robustly parse IRC LIST response for channel names
-                    if ' 322 ' in line or (line.startswith(':') and ' 322 ' in line):
-                        parts = line.split()
-                        for part in parts:
-                            if part.startswith('#'):
-                                channels.add(part)
-                                break
-                    if ' 323 ' in line:
-                        break
-            except Exception:
-                break
-        self.root.after(0, self._update_channel_select_window, sorted(channels))
+    def channel_list(self, channels):
+        self.root.after(0, self._update_channel_select_window, channels)
 
     def _update_channel_select_window(self, channels):
         # Remove loading label if present
@@ -386,6 +958,8 @@ class IRCGui:
     def disconnect(self):
         if self.client and self.client.sock:
             try:
+                # Otherwise the listen loop takes the close for a dropped link
+                self.client.auto_reconnect = False
                 self.client.sock.close()
                 self.append_message("Disconnected from server.")
             except Exception as e:
@@ -394,6 +968,41 @@ class IRCGui:
             # Disable entry after disconnect
             self.entry.config(state='disabled')
 
+    def _new_client(self, server, port, nickname, channel, client_class=None):
+        return new_client(self.settings, self, server, port, nickname, channel,
+                          plugins=self.plugins, client_class=client_class)
+
+    def lag_updated(self, seconds, pending=False):
+        text = f"Lag: {seconds:.1f} s" + ("?" if pending else "") if seconds >= 1 else f"Lag: {seconds * 1000:.0f} ms"
+        self.root.after(0, lambda: self.lag_label.config(text=text))
+
+    def names_updated(self, channel, users):
+        if self.client and channel == self.client.channel:
+            def update():
+                self.users = set(users)
+                self._update_user_listbox()
+            self.root.after(0, update)
+
+    def overload_message(self, text):
+        # Overload notices and summaries come from the flusher thread
+        self.root.after(0, self.append_message, text)
+
+    def membership_changed(self, batch):
+        # One user list update for a whole overload interval
+        if not self.client:
+            return
+        channel = self.client.channel
+        def update():
+            for event_channel, nick, joined in batch.events:
+                if event_channel is not None and event_channel != channel:
+                    continue
+                if joined:
+                    self.users.add(nick)
+                else:
+                    self.users.discard(nick)
+            self._update_user_listbox()
+        self.root.after(0, update)
+
     def setup_connection(self):
         win = tk.Toplevel(self.root)
         win.title("Connect to IRC Server")
@@ -408,7 +1017,7 @@ class IRCGui:
         tk.Label(win, text="Nickname:").pack()
         nick_entry = tk.Entry(win)
         nick_entry.pack()
-        tk.Label(win, text="Channel (optional):").pack()
+        tk.Label(win, text="Channels (optional, e.g. #a, #b key):").pack()
         chan_entry = tk.Entry(win)
         chan_entry.pack()
 
@@ -425,13 +1034,16 @@ class IRCGui:
             except ValueError:
                 messagebox.showerror("Error", "Port must be a number.", parent=win)
                 return
-            self.client = IRCClient(server, port, nickname, channel if channel else None, self)
+            channels = self._parse_channel_entry(channel)
+            self.client = self._new_client(server, port, nickname, channels[0][0] if channels else None)
             self.append_message(f"Connecting to {server} as {nickname}...")
+            # Joins are queued and sent in batches once registration completes
+            self.client.join_many(channels)
             self.client.connect()
-            if channel:
-                self.client.channel = channel
-                self.client.sock.send(f"JOIN {channel}\r\n".encode('utf-8'))
-                self.append_message(f"Joining channel {channel}...")
+            if channels:
+                for name, key in channels:
+                    self._open_channel_tab(name, select=(name == channels[0][0]))
+                self.append_message(f"Joining {', '.join(name for name, _ in channels)}...")
                 self.entry.config(state='normal')  # Enable input after joining channel
             else:
                 self.entry.config(state='disabled')
@@ -441,6 +1053,15 @@ class IRCGui:
         connect_btn = tk.Button(win, text="Connect", command=connect)
         connect_btn.pack(fill=tk.X, padx=10, pady=10)
 
+    def _parse_channel_entry(self, text):
+        # "#a, #b key, #c" -> [("#a", None), ("#b", "key"), ("#c", None)]
+        channels = []
+        for item in text.split(','):
+            parts = item.split()
+            if parts:
+                channels.append((parts[0], parts[1] if len(parts) > 1 else None))
+        return channels
+
     def _open_private_message(self, event):
         selection = self.user_listbox.curselection()
         if not selection:
@@ -467,7 +1088,7 @@ class IRCGui:
         def send_pm(event=None):
             msg = pm_entry.get()
             if msg:
-                self.client.sock.send(f"PRIVMSG {user} :{msg}\r\n".encode('utf-8'))
+                self.client.send_raw(f"PRIVMSG {user} :{msg}")
                 timestamp = datetime.datetime.now().strftime("[%H:%M:%S]")
                 pm_text.config(state='normal')
                 pm_text.insert(tk.END, f"{timestamp} You -> {user}: {msg}\n")
@@ -494,7 +1115,7 @@ class IRCGui:
                 msg = pm_entry2.get()
                 if msg:
                     # Send only to the selected user, not to the main channel
-                    self.client.sock.send(f"PRIVMSG {user} :{msg}\r\n".encode('utf-8'))
+                    self.client.send_raw(f"PRIVMSG {user} :{msg}")
                     pm_text2.config(state='normal')
                     pm_text2.insert(tk.END, f"You -> {user}: {msg}\n")
                     pm_text2.yview(tk.END)
@@ -515,43 +1136,15 @@ class IRCGui:
         undock_btn = tk.Button(pm_tab, text="Undock", command=undock)
         undock_btn.pack(padx=10, pady=(0,10))
 
-    def _open_channel_tab(self, channel):
-        # Check if tab already exists
-        for tab_id in self.tabs.tabs():
-            if self.tabs.tab(tab_id, "text") == channel:
-                self.tabs.select(tab_id)
-                return
-        # Remove all channel tabs before opening the new one
-        for tab_id in self.tabs.tabs():
-            if self.tabs.tab(tab_id, "text").startswith("#"):
-                self.tabs.forget(tab_id)
-        # Create new tab for channel
-        chan_tab = tk.Frame(self.tabs, bg=self.theme_colors[self.theme]["tab_bg"])
-        self.tabs.add(chan_tab, text=channel)
-        # Always add a ScrolledText chat view to the channel tab
-        chan_text = scrolledtext.ScrolledText(chan_tab, state='disabled', width=60, height=20,
-                                              bg=self.theme_colors[self.theme]["tab_bg"],
-                                              fg=self.theme_colors[self.theme]["tab_fg"],
-                                              insertbackground=self.theme_colors[self.theme]["tab_fg"])
-        chan_text.pack(fill=tk.BOTH, expand=True)
-        self.tabs.select(chan_tab)
-        # Load chat history if exists
-        history_key = f"chan_{channel}"
-        if history_key in self.tab_histories:
-            chan_text.config(state='normal')
-            chan_text.insert(tk.END, self.tab_histories[history_key])
-            chan_text.config(state='disabled')
-        # Request updated user list for the channel after joining
-        if self.client and channel:
-            try:
-                self.client.sock.send(f"NAMES {channel}\r\n".encode('utf-8'))
-            except Exception:
-                pass
-
     def append_message(self, message):
         # Route all messages to the correct tab
         routed = False
         timestamp = datetime.datetime.now().strftime("[%H:%M:%S]")
+        # Give every channel we join its own tab
+        parts = message.split(None, 3)
+        if len(parts) >= 3 and parts[1] == 'JOIN' and self.client \
+                and parts[0][1:].split('!')[0] == self.client.nickname:
+            self._open_channel_tab(parts[2].lstrip(':'), select=False)
         if 'PRIVMSG' in message:
             try:
                 parts = message.split()
@@ -583,28 +1176,17 @@ class IRCGui:
                                     history_key = f"pm_{sender}"
                                     self.tab_histories[history_key] = child.get('1.0', tk.END)
                                     routed = True
-                                    # Sound notification
-                                    if winsound:
-                                        winsound.Beep(1000, 200)
                                     break
                             break
+                    # Sound/desktop notification, handled on the notifier's own thread
+                    self.notifier.notify(sender, msg_text)
                 # Channel message
                 elif target and target.startswith("#"):
-                    for tab_id in self.tabs.tabs():
-                        if self.tabs.tab(tab_id, "text") == target:
-                            tab_widget = self.tabs.nametowidget(tab_id)
-                            for child in tab_widget.winfo_children():
-                                if isinstance(child, scrolledtext.ScrolledText):
-                                    child.config(state='normal')
-                                    child.insert(tk.END, f"{timestamp} {sender}: {msg_text}\n")
-                                    child.yview(tk.END)
-                                    child.config(state='disabled')
-                                    # Save history
-                                    history_key = f"chan_{target}"
-                                    self.tab_histories[history_key] = child.get('1.0', tk.END)
-                                    routed = True
-                                    break
-                            break
+                    tab = self.channel_tabs.get(irc_casefold(target))
+                    if tab:
+                        # Tab text and unread count belong to the Tk thread
+                        self.root.after(0, self._append_to_channel_tab, tab, f"{timestamp} {sender}: {msg_text}\n")
+                        routed = True
             except Exception:
                 pass
         # Fallback: show in main tab's ScrolledText if not routed
@@ -646,39 +1228,97 @@ class IRCGui:
                     child.config(bg=colors["bg"], fg=colors["label_fg"])
                 elif isinstance(child, tk.Button):
                     child.config(bg=colors["button_bg"], fg=colors["button_fg"])
-    def _open_channel_tab(self, channel):
-        # Check if tab already exists
-        for tab_id in self.tabs.tabs():
-            if self.tabs.tab(tab_id, "text") == channel:
-                self.tabs.select(tab_id)
-                return
-        # Remove all channel tabs before opening the new one
-        for tab_id in self.tabs.tabs():
-            if self.tabs.tab(tab_id, "text").startswith("#"):
-                self.tabs.forget(tab_id)
-        # Create new tab for channel
-        chan_tab = tk.Frame(self.tabs, bg=self.theme_colors[self.theme]["tab_bg"])
-        self.tabs.add(chan_tab, text=channel)
-        # Always add a ScrolledText chat view to the channel tab
-        chan_text = scrolledtext.ScrolledText(chan_tab, state='disabled', width=60, height=20,
-                                              bg=self.theme_colors[self.theme]["tab_bg"],
-                                              fg=self.theme_colors[self.theme]["tab_fg"],
-                                              insertbackground=self.theme_colors[self.theme]["tab_fg"])
-        chan_text.pack(fill=tk.BOTH, expand=True)
-        self.tabs.select(chan_tab)
-        # Load chat history if exists
-        history_key = f"chan_{channel}"
-        if history_key in self.tab_histories:
-            chan_text.config(state='normal')
-            chan_text.insert(tk.END, self.tab_histories[history_key])
-            chan_text.config(state='disabled')
-        # Request updated user list for the channel after joining
-        if self.client and channel:
+    def _open_channel_tab(self, channel, select=True):
+        key = irc_casefold(channel)
+        tab = self.channel_tabs.get(key)
+        if tab is None:
+            frame = tk.Frame(self.tabs, bg=self.theme_colors[self.theme]["tab_bg"])
+            tab = ChannelTab(channel, frame, self.scrollback_lines)
+            self.channel_tabs[key] = tab
+            self.tabs.add(frame, text=channel)
+        if select:
+            # Waking the tab and requesting NAMES happens in _on_tab_changed
+            self.tabs.select(tab.frame)
+
+    def _channel_tab_for(self, tab_id):
+        for tab in self.channel_tabs.values():
+            if str(tab.frame) == str(tab_id):
+                return tab
+        return None
+
+    def _on_tab_changed(self, event=None):
+        now = time.monotonic()
+        if self._current_channel_tab:
+            self._current_channel_tab.last_viewed = now
+        tab = self._channel_tab_for(self.tabs.select())
+        self._current_channel_tab = tab
+        if tab is None:
+            return
+        self._wake_tab(tab)
+        if self.client and self.client.channel != tab.name:
+            self.client.channel = tab.name
+            self.users = set()
+            self._update_user_listbox()
+        # Request updated user list for the channel
+        if self.client:
             try:
-                self.client.sock.send(f"NAMES {channel}\r\n".encode('utf-8'))
+                self.client.send_raw(f"NAMES {tab.name}")
             except Exception:
                 pass
 
+    def _wake_tab(self, tab):
+        tab.last_viewed = time.monotonic()
+        if tab.text is None:
+            colors = self.theme_colors[self.theme]
+            tab.text = scrolledtext.ScrolledText(tab.frame, state='disabled', width=60, height=20,
+                                                 bg=colors["tab_bg"], fg=colors["tab_fg"],
+                                                 insertbackground=colors["tab_fg"])
+            tab.text.pack(fill=tk.BOTH, expand=True)
+            if tab.lines:
+                # Rebuild with a single insert rather than one per stored line
+                tab.text.config(state='normal')
+                tab.text.insert(tk.END, ''.join(tab.lines))
+                tab.text.yview(tk.END)
+                tab.text.config(state='disabled')
+        if tab.unread:
+            tab.unread = 0
+            self.tabs.tab(tab.frame, text=tab.name)
+        live = [t for t in self.channel_tabs.values() if t.text is not None and t is not tab]
+        if len(live) >= self.max_live_tabs:
+            live.sort(key=lambda t: t.last_viewed)
+            for t in live[:len(live) - self.max_live_tabs + 1]:
+                self._hibernate_tab(t)
+
+    def _hibernate_tab(self, tab):
+        if tab.text is None:
+            return
+        # Destroys the ScrolledText together with its frame and scrollbar
+        for child in tab.frame.winfo_children():
+            child.destroy()
+        tab.text = None
+
+    def _hibernate_idle_tabs(self):
+        now = time.monotonic()
+        for tab in self.channel_tabs.values():
+            if tab is not self._current_channel_tab and tab.text is not None \
+                    and now - tab.last_viewed > self.hibernate_after:
+                self._hibernate_tab(tab)
+        self.root.after(self.hibernate_check_interval, self._hibernate_idle_tabs)
+
+    def _append_to_channel_tab(self, tab, line):
+        tab.lines.append(line)
+        if tab.text is not None:
+            tab.text.config(state='normal')
+            tab.text.insert(tk.END, line)
+            excess = int(tab.text.index('end-1c').split('.')[0]) - 1 - self.scrollback_lines
+            if excess > 0:
+                tab.text.delete('1.0', f"{excess + 1}.0")
+            tab.text.yview(tk.END)
+            tab.text.config(state='disabled')
+        if tab is not self._current_channel_tab:
+            tab.unread += 1
+            self.tabs.tab(tab.frame, text=f"{tab.name} ({tab.unread})")
+
     def _parse_user_list(self, message):
         # Accumulate all users from multiple 353 replies until 366 is received
         if not hasattr(self, '_pending_names_users'):
@@ -737,10 +1377,9 @@ class IRCGui:
     def send_message(self, event=None):
         msg = self.entry.get()
         if msg and self.client:
-            selected_tab = self.tabs.select()
-            tab_text = self.tabs.tab(selected_tab, "text")
-            if tab_text.startswith("#"):
-                self.client.sock.send(f"PRIVMSG {tab_text} :{msg}\r\n".encode('utf-8'))
+            tab = self._channel_tab_for(self.tabs.select())
+            if tab:
+                self.client.send_raw(f"PRIVMSG {tab.name} :{msg}")
                 self.entry.delete(0, tk.END)
             else:
                 if self.client.channel:
@@ -790,6 +1429,44 @@ class IRCGui:
         if self.client:
             self.client.reconnect()
 
+    def start_recording(self):
+        if not self.client:
+            messagebox.showinfo("Info", "Connect to a server first.")
+            return
+        path = filedialog.asksaveasfilename(title="Record traffic to", defaultextension=".ircrec",
+                                            filetypes=[("IRC recordings", "*.ircrec *.ircrec.gz")],
+                                            parent=self.root)
+        if path:
+            self.client.start_recording(path)
+            self.append_message(f"Recording traffic to {path}")
+
+    def stop_recording(self):
+        if self.client and self.client.recorder:
+            recorder = self.client.recorder
+            self.client.stop_recording()
+            self.append_message(f"Recorded {recorder.lines} lines to {recorder.path}")
+
+    def _run_diagnostics(self, action):
+        try:
+            self.append_message(action())
+        except Exception as e:
+            messagebox.showerror("Diagnostics", str(e))
+
+    def show_plugin_status(self):
+        handlers = self.plugins.all_handlers()
+        if not handlers:
+            messagebox.showinfo("Plugin Status", "No plugins loaded.")
+            return
+        lines = [h.describe() for h in handlers]
+        if self.plugins.dropped:
+            lines.append(f"{self.plugins.dropped} events dropped because the worker pool was full")
+        if messagebox.askyesno("Plugin Status", "\n".join(lines) + "\n\nRe-enable disabled handlers?"):
+            for h in handlers:
+                if not h.enabled:
+                    h.enabled = True
+                    h.disabled_reason = None
+                    h.strikes = 0
+
     def clear_chat(self):
         self.main_text.config(state='normal')
         self.main_text.delete('1.0', tk.END)
@@ -826,15 +1503,149 @@ class IRCGui:
     def whois_selected_user(self):
         selection = self.user_listbox.curselection()
         if selection and self.client:
-            user = self.user_listbox.get(selection[0])
+            user = self.user_listbox.get(selection[0]).lstrip('@+%~&')
             try:
-                self.client.sock.send(f"WHOIS {user}\r\n".encode('utf-8'))
-                self.append_message(f"Requested WHOIS for {user}")
+                # Served from the cache when a recent WHOIS exists; no network round trip
+                if not self.client.userinfo.whois(user, lambda info: self.root.after(0, self._show_user_info, info)):
+                    self.append_message(f"Requested WHOIS for {user}")
             except Exception as e:
                 self.append_message(f"WHOIS error: {e}")
 
+    def _show_user_info(self, info):
+        if info.missing:
+            messagebox.showinfo("Whois", f"No such nick: {info.nick}")
+            return
+        win = tk.Toplevel(self.root)
+        win.title(f"Whois {info.nick}")
+        for row, (label, value) in enumerate(info.fields()):
+            tk.Label(win, text=f"{label}:", anchor=tk.E).grid(row=row, column=0, sticky=tk.E, padx=(10, 5), pady=2)
+            tk.Label(win, text=value, anchor=tk.W, wraplength=300, justify=tk.LEFT).grid(
+                row=row, column=1, sticky=tk.W, padx=(0, 10), pady=2)
+        age = int(time.monotonic() - info.fetched)
+        tk.Label(win, text=f"Fetched {age} s ago", fg="grey").grid(row=row + 1, column=0, columnspan=2, pady=5)
+        tk.Button(win, text="Close", command=win.destroy).grid(row=row + 2, column=0, columnspan=2, pady=(0, 10))
+
+    def show_hosts(self):
+        if not self.client:
+            return
+        nicks = [u.lstrip('@+%~&') for u in self.user_listbox.get(0, tk.END)]
+        if not nicks:
+            return
+        self.append_message(f"Looking up hosts for {len(nicks)} users...")
+        self.client.userinfo.lookup_many(nicks, channel=self.client.channel,
+                                         callback=lambda infos: self.root.after(0, self._show_hosts_window, nicks, infos))
+
+    def _show_hosts_window(self, nicks, infos):
+        win = tk.Toplevel(self.root)
+        win.title(f"Hosts in {self.client.channel if self.client else ''}")
+        win.geometry("450x400")
+        listbox = tk.Listbox(win)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        for nick in nicks:
+            info = infos.get(irc_casefold(nick))
+            listbox.insert(tk.END, f"{nick}  {info.user}@{info.host}" if info and info.host else f"{nick}  (unknown)")
+
+    def _on_user_hover(self, event):
+        if not self.client or not self.user_listbox.size():
+            return
+        nick = self.user_listbox.get(self.user_listbox.nearest(event.y)).lstrip('@+%~&')
+        if nick == self._hover_nick:
+            return
+        self._hover_nick = nick
+        info = self.client.userinfo.get(nick)
+        if info:
+            self._set_hover(info)
+        else:
+            # Hovering across many names gathers them into one WHO
+            self.hover_label.config(text=f"{nick}: looking up...")
+            self.client.userinfo.lookup_many([nick], channel=self.client.channel,
+                                             callback=lambda infos: self.root.after(0, self._set_hover, infos.get(irc_casefold(nick)), nick))
+
+    def _set_hover(self, info, nick=None):
+        if info is None:
+            if nick is None or nick == self._hover_nick:
+                self.hover_label.config(text="")
+            if nick is None:
+                self._hover_nick = None
+            return
+        if nick is None or nick == self._hover_nick:
+            self.hover_label.config(text=f"{info.nick}: {info.user}@{info.host}" if info.host else info.nick)
+
+    def send_file_to_selected_user(self, passive=False):
+        selection = self.user_listbox.curselection()
+        if not selection or not self.client:
+            return
+        user = self.user_listbox.get(selection[0]).lstrip('@+%~&')
+        path = filedialog.askopenfilename(title=f"Send file to {user}", parent=self.root)
+        if not path:
+            return
+        try:
+            t = self.client.dcc.offer(user, path, passive=passive)
+            mode = "passive " if passive else ""
+            self.append_message(f"Offering {t.filename} ({format_size(t.size)}) to {user} via {mode}DCC")
+            self.show_transfers()
+        except Exception as e:
+            self.append_message(f"DCC error: {e}")
+
+    def dcc_offer(self, transfer):
+        # Called from the network thread; prompt on the Tk thread
+        self.root.after(0, self._prompt_dcc_offer, transfer)
+
+    def dcc_updated(self, transfer):
+        self.root.after(0, self._refresh_transfers_window)
+        if transfer.state in ("done", "failed", "cancelled"):
+            self.root.after(0, self.append_message, f"DCC {transfer.describe()}")
+
+    def _prompt_dcc_offer(self, t):
+        if not messagebox.askyesno("DCC Offer", f"{t.nick} wants to send you {t.filename} "
+                                                f"({format_size(t.size)}). Accept?"):
+            self.client.dcc.decline(t)
+            return
+        path = filedialog.asksaveasfilename(title="Save file as", initialfile=t.filename, parent=self.root)
+        if not path:
+            self.client.dcc.decline(t)
+            return
+        resume = False
+        if os.path.exists(path + ".part"):
+            resume = messagebox.askyesno("Resume Transfer", "A partial download exists. Resume it?")
+        self.client.dcc.accept(t, path, resume=resume)
+        self.show_transfers()
+
+    def show_transfers(self):
+        if self.transfers_win and tk.Toplevel.winfo_exists(self.transfers_win):
+            self.transfers_win.lift()
+            return
+        self.transfers_win = tk.Toplevel(self.root)
+        self.transfers_win.title("File Transfers")
+        self.transfers_win.geometry("600x250")
+        self.transfers_listbox = tk.Listbox(self.transfers_win)
+        self.transfers_listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        def cancel_selected():
+            sel = self.transfers_listbox.curselection()
+            if sel and self.client:
+                self.client.dcc.cancel(self.client.dcc.transfers[sel[0]])
+        tk.Button(self.transfers_win, text="Cancel Transfer", command=cancel_selected).pack(pady=(0, 10))
+        self._refresh_transfers_window()
+
+    def _refresh_transfers_window(self):
+        if not (self.transfers_win and tk.Toplevel.winfo_exists(self.transfers_win)):
+            return
+        transfers = self.client.dcc.transfers if self.client else []
+        self.transfers_listbox.delete(0, tk.END)
+        for t in transfers:
+            self.transfers_listbox.insert(tk.END, t.describe())
+        # Keep throughput/ETA ticking while anything is in flight
+        if any(t.state in ("active", "connecting", "waiting") for t in transfers):
+            if not getattr(self, "_transfers_tick", None):
+                def tick():
+                    self._transfers_tick = None
+                    self._refresh_transfers_window()
+                self._transfers_tick = self.root.after(1000, tick)
+
 
 if __name__ == "__main__":
     root = tk.Tk()
     gui = IRCGui(root)
+    # kill -USR1 / -USR2 toggle the profiler / memory trace as the menu does
+    install_signal_handlers(gui.diagnostics, report=lambda text: root.after(0, gui.append_message, text))
     root.mainloop()
@@ -0,0 +1,449 @@
+import mmap
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+CHUNK_SIZE = 1 << 20
+ACCEPT_TIMEOUT = 120
+UPDATE_INTERVAL = 0.25
+
+
+def ip_to_dcc(ip):
+    # DCC carries IPv4 addresses as a single unsigned integer, IPv6 as text
+    if ':' in ip:
+        return ip
+    return str(struct.unpack('!I', socket.inet_aton(ip))[0])
+
+
+def dcc_to_ip(value):
+    if value.isdigit():
+        return socket.inet_ntoa(struct.pack('!I', int(value)))
+    return value
+
+
+def format_size(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024
+
+
+def parse_dcc(text):
+    # Split a "DCC <type> <file> <args...>" CTCP body, honouring quoted file names
+    text = text.strip('\x01').strip()
+    if not text.upper().startswith('DCC '):
+        return None
+    rest = text[4:].lstrip()
+    kind, _, rest = rest.partition(' ')
+    rest = rest.lstrip()
+    if rest.startswith('"'):
+        end = rest.find('"', 1)
+        if end == -1:
+            return None
+        filename, args = rest[1:end], rest[end + 1:].split()
+    else:
+        parts = rest.split()
+        if not parts:
+            return None
+        filename, args = parts[0], parts[1:]
+    return kind.upper(), os.path.basename(filename), args
+
+
+def quote_filename(name):
+    return f'"{name}"' if ' ' in name else name
+
+
+class DCCTransfer:
+    def __init__(self, direction, nick, filename, size, path=None, passive=False, token=None):
+        self.direction = direction  # "send" or "receive"
+        self.nick = nick
+        self.filename = filename
+        self.size = size
+        self.path = path
+        self.passive = passive
+        self.token = token
+        self.host = None
+        self.port = 0
+        self.offset = 0
+        self.transferred = 0
+        self.state = "pending"
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.listener = None
+        self.sock = None
+        self._cancel = threading.Event()
+
+    @property
+    def position(self):
+        return self.offset + self.transferred
+
+    @property
+    def rate(self):
+        if not self.started or not self.transferred:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.transferred / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        rate = self.rate
+        if not rate:
+            return None
+        return (self.size - self.position) / rate
+
+    def describe(self):
+        arrow = "->" if self.direction == "send" else "<-"
+        pct = (100 * self.position / self.size) if self.size else 100
+        line = f"{arrow} {self.nick} {self.filename} [{self.state}] {pct:.0f}% of {format_size(self.size)}"
+        if self.state == "active":
+            eta = self.eta
+            line += f" {self.rate / 1048576:.2f} MB/s"
+            if eta is not None:
+                line += f" ETA {int(eta // 60)}:{int(eta % 60):02d}"
+        elif self.state == "done" and self.finished:
+            line += f" {self.rate / 1048576:.2f} MB/s"
+        elif self.error:
+            line += f" ({self.error})"
+        return line
+
+    def cancel(self):
+        self._cancel.set()
+        for s in (self.listener, self.sock):
+            if s:
+                try:
+                    s.close()
+                except Exception:
+                    pass
+
+
+class DCCManager:
+    def __init__(self, send_raw, local_ip, on_update=None, on_offer=None, on_message=None):
+        self.send_raw = send_raw
+        self.local_ip = local_ip
+        self.on_update = on_update or (lambda transfer: None)
+        self.on_offer = on_offer or (lambda transfer: None)
+        self.on_message = on_message or (lambda text: None)
+        self.transfers = []
+        self._lock = threading.Lock()
+        self._next_token = 1
+
+    def _ctcp(self, nick, body):
+        self.send_raw(f"PRIVMSG {nick} :\x01{body}\x01")
+
+    def _new_token(self):
+        with self._lock:
+            token = str(self._next_token)
+            self._next_token += 1
+        return token
+
+    def _find(self, nick, filename, port=None, token=None, direction=None):
+        for t in reversed(self.transfers):
+            if t.nick.lower() != nick.lower() or t.filename != filename:
+                continue
+            if direction and t.direction != direction:
+                continue
+            if t.state not in ("pending", "waiting"):
+                continue
+            if token is not None and t.token == token:
+                return t
+            if token is None and port is not None and str(t.port) == str(port):
+                return t
+        return None
+
+    # Outgoing
+
+    def offer(self, nick, path, passive=False):
+        size = os.path.getsize(path)
+        t = DCCTransfer("send", nick, os.path.basename(path), size, path=path, passive=passive)
+        ip = ip_to_dcc(self.local_ip())
+        name = quote_filename(t.filename)
+        self.transfers.append(t)
+        if passive:
+            t.token = self._new_token()
+            t.state = "waiting"
+            self._ctcp(nick, f"DCC SEND {name} {ip} 0 {size} {t.token}")
+        else:
+            t.listener = self._listen()
+            t.port = t.listener.getsockname()[1]
+            t.state = "waiting"
+            self._ctcp(nick, f"DCC SEND {name} {ip} {t.port} {size}")
+            threading.Thread(target=self._run_send_listening, args=(t,), daemon=True).start()
+        self.on_update(t)
+        return t
+
+    def _listen(self):
+        family = socket.AF_INET6 if ':' in self.local_ip() else socket.AF_INET
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        listener.bind(('', 0))
+        listener.listen(1)
+        listener.settimeout(ACCEPT_TIMEOUT)
+        return listener
+
+    def _run_send_listening(self, t):
+        try:
+            conn, _ = t.listener.accept()
+        except Exception as e:
+            self._fail(t, "no connection" if isinstance(e, socket.timeout) else e)
+            return
+        finally:
+            t.listener.close()
+        self._send_over(t, conn)
+
+    def _run_send_connecting(self, t):
+        try:
+            conn = socket.create_connection((t.host, t.port), timeout=30)
+        except Exception as e:
+            self._fail(t, e)
+            return
+        self._send_over(t, conn)
+
+    def _send_over(self, t, conn):
+        t.sock = conn
+        conn.settimeout(None)
+        t.state = "active"
+        t.started = time.monotonic()
+        self.on_update(t)
+        last = 0.0
+        acks = b""
+        try:
+            with open(t.path, "rb") as f:
+                pos = t.offset
+                while pos < t.size:
+                    if t._cancel.is_set():
+                        raise ConnectionAbortedError("cancelled")
+                    # socket.sendfile uses os.sendfile where available, so the
+                    # file pages go straight from the page cache to the socket
+                    sent = conn.sendfile(f, offset=pos, count=min(CHUNK_SIZE * 4, t.size - pos))
+                    if not sent:
+                        raise ConnectionError("peer closed connection")
+                    pos += sent
+                    t.transferred = pos - t.offset
+                    # Read the acks as they come, or a receiver blocked on
+                    # sending them stops reading and both sides stall
+                    acks = self._drain_acks(conn, acks)
+                    now = time.monotonic()
+                    if now - last >= UPDATE_INTERVAL:
+                        last = now
+                        self.on_update(t)
+            self._await_final_ack(t, conn, acks)
+            self._finish(t)
+        except Exception as e:
+            self._fail(t, e)
+        finally:
+            conn.close()
+
+    def _drain_acks(self, conn, buf):
+        # Whatever acks are already waiting, without blocking; keeps the last one
+        while select.select([conn], [], [], 0)[0]:
+            data = conn.recv(65536)
+            if not data:
+                break
+            buf += data
+        return buf[-4 - len(buf) % 4:] if len(buf) >= 4 else buf
+
+    def _await_final_ack(self, t, conn, buf=b""):
+        # Receivers acknowledge the running byte count as a 32-bit integer
+        want = t.size & 0xffffffff
+        usable = len(buf) - len(buf) % 4
+        if usable and struct.unpack('!I', buf[usable - 4:usable])[0] == want:
+            return
+        buf = buf[usable:]
+        conn.settimeout(10)
+        try:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    return
+                buf += data
+                usable = len(buf) - len(buf) % 4
+                if usable and struct.unpack('!I', buf[usable - 4:usable])[0] == want:
+                    return
+                buf = buf[usable:]
+        except socket.timeout:
+            pass
+
+    # Incoming
+
+    def handle_ctcp(self, nick, text):
+        parsed = parse_dcc(text)
+        if not parsed:
+            return False
+        kind, filename, args = parsed
+        try:
+            if kind == "SEND":
+                self._handle_send(nick, filename, args)
+            elif kind == "RESUME":
+                self._handle_resume(nick, filename, args)
+            elif kind == "ACCEPT":
+                self._handle_accept(nick, filename, args)
+            else:
+                self.on_message(f"Unsupported DCC {kind} from {nick}")
+        except (ValueError, IndexError):
+            self.on_message(f"Malformed DCC {kind} from {nick}: {text.strip(chr(1))}")
+        return True
+
+    def _handle_send(self, nick, filename, args):
+        host, port, size = dcc_to_ip(args[0]), int(args[1]), int(args[2])
+        token = args[3] if len(args) > 3 else None
+        if token is not None and port:
+            # Reply to one of our passive offers: the peer is listening now
+            t = self._find(nick, filename, token=token, direction="send")
+            if t:
+                t.host, t.port = host, port
+                t.state = "connecting"
+                self.on_update(t)
+                threading.Thread(target=self._run_send_connecting, args=(t,), daemon=True).start()
+                return
+        t = DCCTransfer("receive", nick, filename, size, passive=(port == 0), token=token)
+        t.host, t.port = host, port
+        self.transfers.append(t)
+        self.on_offer(t)
+
+    def accept(self, t, path, resume=False):
+        t.path = path
+        part = path + ".part"
+        if resume and os.path.exists(part):
+            t.offset = min(os.path.getsize(part), t.size)
+        if t.offset and t.offset < t.size:
+            t.state = "waiting"
+            port = 0 if t.passive else t.port
+            body = f"DCC RESUME {quote_filename(t.filename)} {port} {t.offset}"
+            if t.passive:
+                body += f" {t.token}"
+            self._ctcp(t.nick, body)
+            self.on_update(t)
+            return
+        t.offset = 0
+        self._start_receive(t)
+
+    def decline(self, t):
+        t.state = "declined"
+        self.on_update(t)
+
+    def cancel(self, t):
+        t.cancel()
+        if t.state in ("pending", "waiting") and t.listener is None:
+            # No thread is waiting on a socket that would notice and report it
+            t.finished = time.monotonic()
+            t.state = "cancelled"
+            self.on_update(t)
+
+    def _start_receive(self, t):
+        if t.passive:
+            t.listener = self._listen()
+            port = t.listener.getsockname()[1]
+            t.state = "waiting"
+            ip = ip_to_dcc(self.local_ip())
+            self._ctcp(t.nick, f"DCC SEND {quote_filename(t.filename)} {ip} {port} {t.size} {t.token}")
+            threading.Thread(target=self._run_receive_listening, args=(t,), daemon=True).start()
+        else:
+            t.state = "connecting"
+            threading.Thread(target=self._run_receive_connecting, args=(t,), daemon=True).start()
+        self.on_update(t)
+
+    def _handle_resume(self, nick, filename, args):
+        port, position = args[0], int(args[1])
+        token = args[2] if len(args) > 2 else None
+        t = self._find(nick, filename, port=port, token=token, direction="send")
+        if not t or position >= t.size:
+            return
+        t.offset = position
+        self._ctcp(nick, f"DCC ACCEPT {quote_filename(t.filename)} {port} {position}"
+                         + (f" {token}" if token else ""))
+        self.on_update(t)
+
+    def _handle_accept(self, nick, filename, args):
+        port, position = args[0], int(args[1])
+        token = args[2] if len(args) > 2 else None
+        t = self._find(nick, filename, port=port, token=token, direction="receive")
+        if not t:
+            return
+        t.offset = position
+        self._start_receive(t)
+
+    def _run_receive_listening(self, t):
+        try:
+            conn, _ = t.listener.accept()
+        except Exception as e:
+            self._fail(t, "no connection" if isinstance(e, socket.timeout) else e)
+            return
+        finally:
+            t.listener.close()
+        self._receive_over(t, conn)
+
+    def _run_receive_connecting(self, t):
+        try:
+            conn = socket.create_connection((t.host, t.port), timeout=30)
+        except Exception as e:
+            self._fail(t, e)
+            return
+        self._receive_over(t, conn)
+
+    def _receive_over(self, t, conn):
+        t.sock = conn
+        conn.settimeout(60)
+        t.state = "active"
+        t.started = time.monotonic()
+        self.on_update(t)
+        part = t.path + ".part"
+        pos = t.offset
+        last = 0.0
+        try:
+            with open(part, "r+b" if t.offset else "w+b") as f:
+                # Preallocate the whole file and receive straight into a mapping
+                # of it, so there is no intermediate buffer or write() per chunk
+                f.truncate(t.size)
+                if hasattr(os, "posix_fallocate") and t.size:
+                    try:
+                        os.posix_fallocate(f.fileno(), 0, t.size)
+                    except OSError:
+                        pass
+                mm = mmap.mmap(f.fileno(), t.size) if t.size else None
+                try:
+                    view = memoryview(mm) if mm is not None else None
+                    try:
+                        while pos < t.size:
+                            if t._cancel.is_set():
+                                raise ConnectionAbortedError("cancelled")
+                            n = conn.recv_into(view[pos:pos + CHUNK_SIZE])
+                            if not n:
+                                raise ConnectionError("peer closed connection")
+                            pos += n
+                            t.transferred = pos - t.offset
+                            conn.sendall(struct.pack('!I', pos & 0xffffffff))
+                            now = time.monotonic()
+                            if now - last >= UPDATE_INTERVAL:
+                                last = now
+                                self.on_update(t)
+                    finally:
+                        if view is not None:
+                            view.release()
+                    if mm is not None:
+                        mm.flush()
+                finally:
+                    if mm is not None:
+                        mm.close()
+                    if pos < t.size:
+                        # Keep only what arrived so a later RESUME can pick up here
+                        f.truncate(pos)
+            os.replace(part, t.path)
+            self._finish(t)
+        except Exception as e:
+            self._fail(t, e)
+        finally:
+            conn.close()
+
+    def _finish(self, t):
+        t.finished = time.monotonic()
+        t.state = "done"
+        self.on_update(t)
+
+    def _fail(self, t, error):
+        t.finished = time.monotonic()
+        t.state = "cancelled" if t._cancel.is_set() else "failed"
+        t.error = str(error)
+        self.on_update(t)
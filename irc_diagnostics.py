@@ -0,0 +1,217 @@
+# On-demand profiling of a running client. The sampling profiler sees every
+# thread (listen, plugin workers, the Tk loop) at a small fixed cost; cProfile
+# is exact but only covers the thread that started it. Reports go to
+# diagnostics/ next to this file unless another directory is given.
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+
+def _stamp():
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+
+class SamplingProfiler:
+    # Wall-clock stack sampling of all threads via sys._current_frames()
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = {}  # frame label -> samples where it was on top
+        self.total_counts = {}  # frame label -> samples where it was anywhere on the stack
+        self.stacks = {}  # "thread;outer;...;inner" -> samples
+        self.threads = {}  # thread name -> samples
+        self.started = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if not labels:
+                    continue
+                self.samples += 1
+                self.self_counts[labels[0]] = self.self_counts.get(labels[0], 0) + 1
+                for label in set(labels):
+                    self.total_counts[label] = self.total_counts.get(label, 0) + 1
+                name = names.get(ident, str(ident))
+                self.threads[name] = self.threads.get(name, 0) + 1
+                key = ";".join([name] + labels[::-1])
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def report(self, limit=30):
+        out = [f"{self.samples} samples over {self.elapsed:.1f} s, every {self.interval * 1000:g} ms, all threads",
+               "Threads blocked in I/O or sleeping are sampled too, so time is wall-clock, not CPU", "",
+               "Samples per thread:"]
+        out.extend(f"  {count:8d}  {name}" for name, count in sorted(self.threads.items(), key=lambda item: -item[1]))
+        out.append("")
+        for title, counts in (("self", self.self_counts), ("inclusive", self.total_counts)):
+            out.append(f"Top {limit} by {title} samples:")
+            for label, count in sorted(counts.items(), key=lambda item: -item[1])[:limit]:
+                out.append(f"  {count:8d}  {100 * count / max(self.samples, 1):5.1f}%  {label}")
+            out.append("")
+        return "\n".join(out)
+
+    def folded(self):
+        # Collapsed stacks, the input format of flamegraph.pl and speedscope
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+class Diagnostics:
+    def __init__(self, directory=None, interval=0.005, trace_frames=1):
+        self.directory = directory or os.path.join(os.path.dirname(os.path.abspath(__file__)), "diagnostics")
+        self.interval = interval
+        self.trace_frames = trace_frames  # more frames give tracebacks but slow the client far more
+        self.profiler = None  # SamplingProfiler or cProfile.Profile while profiling
+        self._trace_start = None
+        self._lock = threading.Lock()
+
+    @property
+    def profiling(self):
+        return self.profiler is not None
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def _path(self, kind, ext):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{kind}-{_stamp()}.{ext}")
+
+    # CPU
+
+    def start_profile(self, mode="sampling"):
+        with self._lock:
+            if self.profiler:
+                raise RuntimeError("profiler already running")
+            if mode == "cprofile":
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            else:
+                self.profiler = SamplingProfiler(self.interval)
+                self.profiler.start()
+
+    def stop_profile(self):
+        # Returns the paths of the reports written
+        with self._lock:
+            profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return []
+        if isinstance(profiler, SamplingProfiler):
+            profiler.stop()
+            report, folded = self._path("profile", "txt"), self._path("profile", "folded")
+            with open(report, "w", encoding="utf-8") as f:
+                f.write(profiler.report())
+            with open(folded, "w", encoding="utf-8") as f:
+                f.write(profiler.folded())
+            return [report, folded]
+        profiler.disable()
+        dump, report = self._path("profile", "pstats"), self._path("profile", "txt")
+        profiler.dump_stats(dump)
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(40)
+        stats.sort_stats("tottime").print_stats(40)
+        with open(report, "w", encoding="utf-8") as f:
+            f.write(stream.getvalue())
+        return [dump, report]
+
+    def toggle_profile(self, mode="sampling"):
+        if self.profiling:
+            return "Profiler stopped: " + ", ".join(self.stop_profile())
+        self.start_profile(mode)
+        return f"Profiler started ({mode})"
+
+    # Memory
+
+    def start_trace(self):
+        if self.tracing:
+            raise RuntimeError("tracemalloc already running")
+        tracemalloc.start(self.trace_frames)
+        self._trace_start = tracemalloc.take_snapshot()
+
+    def snapshot(self, limit=30):
+        # Write top allocations (and growth since the trace started); keeps tracing
+        if not self.tracing:
+            raise RuntimeError("tracemalloc is not running")
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                  tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")]
+        snap = tracemalloc.take_snapshot().filter_traces(ignore)
+        current, peak = tracemalloc.get_traced_memory()
+        out = [f"traced memory: {current / 1048576:.1f} MB now, {peak / 1048576:.1f} MB peak", "",
+               f"Top {limit} allocation sites:"]
+        out.extend(f"  {stat}" for stat in snap.statistics("lineno")[:limit])
+        if self._trace_start is not None:
+            out.extend(["", f"Top {limit} growth since the trace started:"])
+            out.extend(f"  {stat}" for stat in snap.compare_to(self._trace_start.filter_traces(ignore),
+                                                               "lineno")[:limit])
+        if tracemalloc.get_traceback_limit() > 1:
+            out.extend(["", "Largest allocation tracebacks:"])
+            for stat in snap.statistics("traceback")[:5]:
+                out.append(f"  {stat.count} blocks, {stat.size / 1024:.1f} KiB")
+                out.extend(f"    {line}" for line in stat.traceback.format(limit=10))
+        path = self._path("memory", "txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(out) + "\n")
+        return path
+
+    def stop_trace(self):
+        if not self.tracing:
+            return None
+        path = self.snapshot()
+        tracemalloc.stop()
+        self._trace_start = None
+        return path
+
+    def toggle_trace(self):
+        if self.tracing:
+            return f"Memory trace stopped: {self.stop_trace()}"
+        self.start_trace()
+        return f"Memory trace started (traceback depth {self.trace_frames})"
+
+
+def install_signal_handlers(diagnostics, report=print):
+    # Headless toggles: SIGUSR1 starts/stops the sampling profiler, SIGUSR2 the
+    # memory trace. Must be called from the main thread; not available on Windows.
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+
+    def toggle(action):
+        def handler(signum, frame):
+            try:
+                report(action())
+            except Exception as e:
+                report(f"Diagnostics error: {e}")
+        return handler
+    signal.signal(signal.SIGUSR1, toggle(diagnostics.toggle_profile))
+    signal.signal(signal.SIGUSR2, toggle(diagnostics.toggle_trace))
+    return True
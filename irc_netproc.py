@@ -0,0 +1,425 @@
+# Network process: socket I/O, framing, PING/PONG, lag and dead-link detection,
+# parsing and classification of every inbound line, the user info cache, the
+# overload guard and the chat log all run here, away from the GUI process's GIL.
+# The GUI receives batches of length-prefixed records over a pipe, one batch per
+# socket read, each record already saying what the line is for; it sends raw
+# outbound bytes, lookups and (with plugin filters) log lines back.
+import json
+import select
+import socket
+import struct
+import threading
+import time
+
+from irc_overload import OverloadGuard
+from irc_protocol import parse_message
+from irc_transport import connect_racing, enable_keepalive
+from irc_userinfo import USERINFO_NUMERICS, UserInfo, UserInfoCache, irc_casefold
+
+RECORD = struct.Struct("<BI")  # kind, payload length
+LINE = 1  # an inbound line to show in the chat
+LAG = 2  # "seconds pending" (pending is 0 or 1)
+CONNECTED = 3  # local address of the IRC connection
+DISCONNECTED = 4  # reason
+NAMES = 5  # "channel nick nick ..." once a NAMES reply is complete
+RAW = 6  # a line handled here, forwarded only so a traffic recording stays complete
+SEEN = 7  # a line handled here, forwarded only for plugins
+DCC = 8  # a DCC CTCP sent to our nick
+REGISTERED = 9  # 001 arrived; queued joins can go out
+NICKNAME = 10  # our own nick changed to this
+USERINFO = 11  # JSON: lookup results ("id", "users") or stale cache entries ("forget")
+STORM = 12  # JSON: one overload interval, summary "lines" and membership "events"
+NOTICE = 13  # overload mode switched on or off
+CHANNELS = 14  # channel names from a LIST, once its 323 arrives
+
+SEND = b"S"
+CLOSE = b"C"
+RECORDING = b"R"  # followed by b"1" or b"0"
+LOOKUP = b"L"  # followed by JSON: "id" and "whois" (a nick) or "nicks" and "channel"
+LOG = b"G"  # followed by a line for the chat log
+
+
+def pack_records(records):
+    out = []
+    for kind, payload in records:
+        data = payload.encode("utf-8", errors="replace") if isinstance(payload, str) else payload
+        out.append(RECORD.pack(kind, len(data)))
+        out.append(data)
+    return b"".join(out)
+
+
+def unpack_records(batch):
+    pos = 0
+    end = len(batch)
+    view = memoryview(batch)
+    while pos < end:
+        kind, length = RECORD.unpack_from(batch, pos)
+        pos += RECORD.size
+        yield kind, bytes(view[pos:pos + length]).decode("utf-8", errors="ignore")
+        pos += length
+
+
+class PipeSocket:
+    # What the GUI process uses as client.sock: writes go to the network process
+    def __init__(self, conn):
+        self.conn = conn
+        self.local_address = ("0.0.0.0", 0)
+        self._lock = threading.Lock()
+
+    def _command(self, data):
+        with self._lock:
+            self.conn.send_bytes(data)
+
+    def send(self, data, *args):
+        self._command(SEND + bytes(data))
+        return len(data)
+
+    def sendall(self, data, *args):
+        self.send(data)
+
+    def set_recording(self, on):
+        self._command(RECORDING + (b"1" if on else b"0"))
+
+    def lookup(self, request):
+        self._command(LOOKUP + json.dumps(request).encode("utf-8"))
+
+    def log(self, line):
+        self._command(LOG + line.encode("utf-8", errors="replace"))
+
+    def getsockname(self):
+        return self.local_address
+
+    def close(self):
+        try:
+            self._command(CLOSE)
+        except Exception:
+            pass
+
+
+class RemoteUserInfo(UserInfoCache):
+    # The GUI process's side of the network process's UserInfoCache: get() and
+    # cache hits are answered from the results sent over, misses become LOOKUP
+    # commands whose callbacks run when the USERINFO answer arrives
+    def __init__(self, **kwargs):
+        super().__init__(None, **kwargs)
+        self.pipe = None  # PipeSocket of the current network process
+        self._requests = {}  # id -> (nicks or None for WHOIS, callback, sent)
+        self._next_id = 0
+
+    def config(self):
+        return {"ttl": self.ttl, "rate": self.rate, "burst": self.burst, "batch_delay": self.batch_delay,
+                "channel_threshold": self.channel_threshold, "query_timeout": self.query_timeout}
+
+    def whois(self, nick, callback):
+        info = self.get(nick, complete=True)
+        if info:
+            self.hits += 1
+            callback(info)
+            return True
+        self.misses += 1
+        self._request({"whois": nick}, None, callback)
+        return False
+
+    def lookup_many(self, nicks, callback=None, channel=None):
+        missing = []
+        for nick in nicks:
+            if self.get(nick):
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.append(nick)
+        if not missing:
+            if callback:
+                callback({irc_casefold(n): self.get(n) for n in nicks})
+            return True
+        self._request({"nicks": missing, "channel": channel}, list(nicks), callback)
+        return False
+
+    def _request(self, request, nicks, callback):
+        now = time.monotonic()
+        with self._cond:
+            self._next_id += 1
+            request["id"] = self._next_id
+            # The network process gives up on unanswered queries; so do we
+            for key, (_, _, sent) in list(self._requests.items()):
+                if now - sent > 2 * self.query_timeout:
+                    del self._requests[key]
+            if callback:
+                self._requests[request["id"]] = (nicks, callback, now)
+        try:
+            self.queries += 1
+            self.pipe.lookup(request)
+        except Exception:
+            self._answer(request["id"], [])
+
+    def deliver(self, payload):
+        # A USERINFO record from the network process
+        data = json.loads(payload)
+        for key in data.get("forget", ()):
+            self._users.pop(key, None)
+        users = [UserInfo.from_dict(d) for d in data.get("users", ())]
+        for info in users:
+            if not info.missing:
+                self._users[irc_casefold(info.nick)] = info
+        if "id" in data:
+            self._answer(data["id"], users)
+
+    def _answer(self, request_id, users):
+        with self._cond:
+            nicks, callback, _ = self._requests.pop(request_id, (None, None, None))
+        if callback is None:
+            return
+        if nicks is None:
+            # WHOIS: the network process answers with exactly one entry
+            if users:
+                callback(users[0])
+        else:
+            callback({irc_casefold(n): self.get(n) for n in nicks})
+
+    def reset(self):
+        # Lookups in flight die with the network process; lookup_many callers
+        # still hear back, as UserInfoCache.reset does for its batches
+        with self._cond:
+            requests, self._requests = self._requests, {}
+        for nicks, callback, _ in requests.values():
+            if nicks is not None:
+                callback({irc_casefold(n): self.get(n) for n in nicks})
+
+
+class _Network:
+    def __init__(self, conn, config):
+        self.conn = conn
+        self.config = config
+        self.sock = None
+        self.recording = config.get("recording", False)
+        self.names = {}  # channel -> nicks collected from 353 until 366
+        self.listing = []  # channel names from 322 until 323
+        self.lag = None
+        self.ping_sent = None
+        self.forward_all = config.get("forward_all", False)
+        # With plugin filters the GUI decides what is shown and sends those lines back to log
+        self.log_here = not config.get("filters", False)
+        self.nickname = config.get("nickname", "")
+        self.last_line = None
+        self.userinfo = UserInfoCache(self.send_line, **config.get("userinfo", {}))
+        self.mirrored = set()  # case-folded nicks whose info the GUI holds a copy of
+        enter_rate, exit_rate, interval = config.get("overload", (150, None, 2.0))
+        self.overload = OverloadGuard(self.storm, on_notice=lambda text: self.emit([(NOTICE, text)]),
+                                      enter_rate=enter_rate, exit_rate=exit_rate, interval=interval)
+        self._emit_lock = threading.Lock()
+        self._log = None
+        self._log_lock = threading.Lock()
+
+    def emit(self, records):
+        # Called from the read loop, the commands thread, the user info sender
+        # and the overload flusher
+        if records:
+            data = pack_records(records)
+            with self._emit_lock:
+                self.conn.send_bytes(data)
+
+    def send_line(self, line):
+        self.sock.sendall(f"{line}\r\n".encode("utf-8"))
+
+    def write_log(self, lines):
+        # One write and flush per batch rather than an open() per line
+        if not lines or not self.config.get("log_file"):
+            return
+        with self._log_lock:
+            try:
+                if self._log is None:
+                    self._log = open(self.config["log_file"], "a", encoding="utf-8")
+                self._log.write("".join(f"{line}\n" for line in lines))
+                self._log.flush()
+            except OSError:
+                pass
+
+    def run(self):
+        try:
+            self.sock = connect_racing(self.config["addresses"], delay=self.config.get("connect_delay", 0.25),
+                                       timeout=self.config.get("connect_timeout", 30))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            enable_keepalive(self.sock)
+            self.sock.sendall("".join(f"{line}\r\n" for line in self.config["registration"]).encode("utf-8"))
+        except Exception as e:
+            self.emit([(DISCONNECTED, str(e))])
+            return
+        self.emit([(CONNECTED, self.sock.getsockname()[0])])
+        threading.Thread(target=self.commands, daemon=True).start()
+        try:
+            self.read_loop()
+        except Exception as e:
+            try:
+                self.emit([(DISCONNECTED, str(e))])
+            except Exception:
+                pass
+        finally:
+            self.sock.close()
+            with self._log_lock:
+                if self._log:
+                    self._log.close()
+                    self._log = None
+
+    def commands(self):
+        while True:
+            try:
+                data = self.conn.recv_bytes()
+            except (EOFError, OSError):
+                data = CLOSE
+            if data[:1] == RECORDING:
+                self.recording = data[1:] == b"1"
+            elif data[:1] == SEND:
+                try:
+                    self.sock.sendall(data[1:])
+                except OSError:
+                    pass
+            elif data[:1] == LOOKUP:
+                self.lookup(json.loads(data[1:].decode("utf-8")))
+            elif data[:1] == LOG:
+                self.write_log([data[1:].decode("utf-8", errors="replace")])
+            elif data[:1] == CLOSE:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                return
+
+    def lookup(self, request):
+        request_id = request["id"]
+
+        def answer(infos):
+            self.mirrored.update(irc_casefold(info.nick) for info in infos)
+            self.emit([(USERINFO, json.dumps({"id": request_id, "users": [i.to_dict() for i in infos]}))])
+        if "whois" in request:
+            self.userinfo.whois(request["whois"], lambda info: answer([info]))
+        else:
+            self.userinfo.lookup_many(request["nicks"], channel=request.get("channel"),
+                                      callback=lambda infos: answer([i for i in infos.values() if i]))
+
+    def storm(self, batch):
+        # Overload flusher thread: log the summaries here, let the GUI show them
+        lines = batch.summary()
+        if self.log_here:
+            self.write_log(lines)
+        self.emit([(STORM, json.dumps({"lines": lines, "events": batch.events}))])
+
+    def read_loop(self):
+        ping_interval = self.config.get("ping_interval", 10)
+        read_timeout = self.config.get("read_timeout", 25)
+        last_recv = time.monotonic()
+        next_ping = last_recv + ping_interval
+        buffer = b""
+        while True:
+            now = time.monotonic()
+            deadline = last_recv + read_timeout
+            if now >= deadline:
+                raise ConnectionError(f"no data from server for {read_timeout} s")
+            if now >= next_ping:
+                self.sock.sendall(f"PING :LAG{time.monotonic_ns()}\r\n".encode("utf-8"))
+                if self.ping_sent is None:
+                    self.ping_sent = now
+                next_ping = now + ping_interval
+            if self.ping_sent and now - self.ping_sent > (self.lag or 0) + 1:
+                self.emit([(LAG, f"{now - self.ping_sent} 1")])
+            # The commands thread sends on this socket, so no socket timeout here
+            readable, _, _ = select.select([self.sock], [], [], max(0.05, min(next_ping, deadline, now + 1) - now))
+            if not readable:
+                continue
+            data = self.sock.recv(65536)
+            if not data:
+                raise ConnectionError("connection closed by server")
+            last_recv = time.monotonic()
+            *lines, buffer = (buffer + data).split(b"\n")
+            records = []
+            log = []
+            for raw in lines:
+                line = raw.rstrip(b"\r").decode("utf-8", errors="ignore")
+                if line:
+                    self.handle(line, records, log)
+            self.emit(records)
+            self.write_log(log)
+
+    def handle(self, line, records, log):
+        # The same decisions IRCClient._handle_line makes in-process, in the same order
+        if self.recording:
+            # Everything, including what is answered or dropped below, goes to the recording
+            records.append((RAW, line))
+        if line.startswith("PING "):
+            self.sock.sendall(f"PONG {line[5:]}\r\n".encode("utf-8"))
+            return
+        msg = parse_message(line)
+        command = msg.command
+        if command == "PONG" and msg.text.startswith("LAG"):
+            # Some servers answer without a prefix: "PONG :LAG<ns>"
+            try:
+                self.lag = time.monotonic() - int(msg.text[3:]) / 1e9
+            except ValueError:
+                return
+            self.ping_sent = None
+            records.append((LAG, f"{self.lag} 0"))
+            return
+        if command == "001":
+            records.append((REGISTERED, ""))
+        consumed = False
+        if command in USERINFO_NUMERICS:
+            # WHOIS/WHO/USERHOST replies to our own lookups fill the cache
+            consumed = self.userinfo.handle(msg)
+        elif command == "NICK":
+            if msg.nick == self.nickname:
+                self.nickname = msg.text
+                records.append((NICKNAME, msg.text))
+            self.userinfo.handle_nick(msg.nick or "", msg.text)
+            self.forget(records, msg.nick or "", msg.text)
+        elif command == "QUIT":
+            self.userinfo.handle_quit(msg.nick or "")
+            self.forget(records, msg.nick or "")
+        elif command == "322":
+            if len(msg.params) >= 2:
+                self.listing.append(msg.params[1])
+            consumed = True
+        elif command == "323":
+            channels, self.listing = self.listing, []
+            records.append((CHANNELS, " ".join(sorted(set(channels), key=irc_casefold))))
+            consumed = True
+        elif command == "353":
+            # ":server 353 me = #chan :a b c"
+            if len(msg.params) >= 3:
+                self.names.setdefault(msg.params[-2], []).extend(msg.params[-1].split())
+            consumed = True
+        elif command == "366":
+            if len(msg.params) >= 2:
+                channel = msg.params[1]
+                records.append((NAMES, " ".join([channel] + self.names.pop(channel, []))))
+            consumed = True
+        elif command == "PRIVMSG" and msg.text.startswith("\x01DCC "):
+            # An offer sent to a channel is not meant for us alone; ignore it
+            if irc_casefold(msg.target or "") == irc_casefold(self.nickname):
+                records.append((DCC, line))
+                return
+            consumed = True
+        if not consumed:
+            # Join/part/quit/mode storms are summarised once per interval instead
+            consumed = self.overload.absorb(line, command, self.nickname, msg)
+        if not consumed and self.log_here:
+            # With filters the GUI drops repeats itself, after filtering, as in-process
+            consumed = line == self.last_line
+        if consumed:
+            if self.forward_all:
+                records.append((SEEN, line))
+            return
+        self.last_line = line
+        records.append((LINE, line))
+        if self.log_here:
+            log.append(line)
+
+    def forget(self, records, *nicks):
+        # Tell the GUI's copy of the user info cache to drop nicks it holds
+        keys = [irc_casefold(n) for n in nicks if irc_casefold(n) in self.mirrored]
+        if keys:
+            self.mirrored.difference_update(keys)
+            records.append((USERINFO, json.dumps({"forget": keys})))
+
+
+def run_network(conn, config):
+    # Entry point of the network process
+    _Network(conn, config).run()
@@ -0,0 +1,183 @@
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import winsound
+except ImportError:
+    winsound = None
+
+
+class TerminalBellBackend:
+    def notify(self, title, body):
+        if sys.stdout:
+            sys.stdout.write('\a')
+            sys.stdout.flush()
+
+
+class TkBellBackend:
+    def __init__(self, root):
+        self.root = root
+
+    def notify(self, title, body):
+        # Tk calls belong on the Tk thread
+        self.root.after(0, self.root.bell)
+
+
+class BeepBackend:
+    def notify(self, title, body):
+        if winsound:
+            winsound.Beep(1000, 200)
+
+
+class _ProcessBackend:
+    def __init__(self):
+        self._procs = []
+
+    def _spawn(self, args):
+        # Reap finished helpers instead of waiting on the new one
+        self._procs = [p for p in self._procs if p.poll() is None]
+        self._procs.append(subprocess.Popen(args, stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+
+class DesktopCommandBackend(_ProcessBackend):
+    def __init__(self, command=None):
+        super().__init__()
+        # "--" keeps a nick or message starting with "-" from being read as an option
+        self.command = command or ["notify-send", "-a", "IRC Client", "--", "{title}", "{body}"]
+
+    def notify(self, title, body):
+        self._spawn([arg.format(title=title, body=body) for arg in self.command])
+
+
+class SoundFileBackend(_ProcessBackend):
+    def __init__(self, path, player=None):
+        super().__init__()
+        self.path = path
+        self.player = player or next((p for p in ("paplay", "aplay", "afplay") if shutil.which(p)), None)
+
+    def notify(self, title, body):
+        if winsound:
+            winsound.PlaySound(self.path, winsound.SND_FILENAME | winsound.SND_ASYNC)
+        elif self.player:
+            self._spawn([self.player, self.path])
+
+
+def build_backends(names, root=None, sound_file=None):
+    # "auto" picks whatever this platform can do without extra setup
+    names = list(names or ["auto"])
+    if "auto" in names:
+        names.remove("auto")
+        if winsound:
+            names.append("beep")
+        else:
+            if shutil.which("notify-send"):
+                names.append("desktop")
+            names.append("tk_bell" if root is not None else "terminal_bell")
+        if sound_file:
+            names.append("sound")
+    backends = []
+    for name in dict.fromkeys(names):
+        if name == "terminal_bell":
+            backends.append(TerminalBellBackend())
+        elif name == "tk_bell" and root is not None:
+            backends.append(TkBellBackend(root))
+        elif name == "beep":
+            backends.append(BeepBackend())
+        elif name == "desktop":
+            backends.append(DesktopCommandBackend())
+        elif name == "sound" and sound_file:
+            backends.append(SoundFileBackend(sound_file))
+    return backends
+
+
+class NotificationService:
+    def __init__(self, backends, window=3.0, min_interval=1.0):
+        self.backends = list(backends)
+        self.window = window  # per-sender coalescing window, seconds
+        self.min_interval = min_interval  # global spacing between notifications
+        self._cond = threading.Condition()
+        self._pending = {}  # case-folded sender -> [sender, count, last text, due time]
+        self._last_sent = {}  # case-folded sender -> last notified, within the window
+        self._next_allowed = 0.0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+        self._thread.start()
+
+    def notify(self, sender, text):
+        # Only a dict update under a short lock; backends run on the worker thread
+        with self._cond:
+            self._add(sender, text, time.monotonic())
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    due = self._take_due(now)
+                    if due:
+                        break
+                    self._cond.wait(self._next_deadline(now))
+                if self._stopped:
+                    return
+            title, body = self._summarize(due)
+            for backend in self.backends:
+                try:
+                    backend.notify(title, body)
+                except Exception:
+                    pass
+
+    def _next_deadline(self, now):
+        if not self._pending:
+            return None
+        due = min(entry[3] for entry in self._pending.values())
+        return max(0.0, max(due, self._next_allowed) - now)
+
+    def _add(self, sender, text, at):
+        key = sender.lower()
+        entry = self._pending.get(key)
+        if entry:
+            entry[1] += 1
+            entry[2] = text
+        else:
+            # First message from a quiet sender is due now; later ones wait out the window
+            last = self._last_sent.get(key)
+            due = at if last is None else max(at, last + self.window)
+            self._pending[key] = [sender, 1, text, due]
+
+    def _take_due(self, now):
+        if now < self._next_allowed:
+            return []
+        due = [(key, entry) for key, entry in self._pending.items() if entry[3] <= now]
+        if due and self._last_sent:
+            # Past the window a sender counts as quiet again; keep only recent ones
+            self._last_sent = {key: at for key, at in self._last_sent.items() if now - at < self.window}
+        for key, _ in due:
+            del self._pending[key]
+            self._last_sent[key] = now
+        if due:
+            self._next_allowed = now + self.min_interval
+        return [entry for _, entry in due]
+
+    def _summarize(self, entries):
+        if len(entries) == 1:
+            sender, count, text, _ = entries[0]
+            if count == 1:
+                return sender, text
+            return sender, f"{count} new messages from {sender}"
+        total = sum(entry[1] for entry in entries)
+        names = [entry[0] for entry in entries]
+        if len(names) > 3:
+            who = f"{', '.join(names[:2])} and {len(names) - 2} others"
+        else:
+            who = ", ".join(names)
+        return "IRC Client", f"{total} new messages from {who}"
@@ -0,0 +1,166 @@
+import re
+import threading
+import time
+
+from irc_protocol import parse_message
+
+STORM_COMMANDS = {"JOIN", "PART", "QUIT", "MODE"}
+# A netsplit QUIT reason is just the two servers that lost each other: "a.net b.net"
+_NETSPLIT = re.compile(r"^([\w-]+(?:\.[\w-]+)+) ([\w-]+(?:\.[\w-]+)+)$")
+_PREVIEW = 5
+
+
+def _nick_list(nicks):
+    shown = ", ".join(nicks[:_PREVIEW])
+    return shown + (f" and {len(nicks) - _PREVIEW} more" if len(nicks) > _PREVIEW else "")
+
+
+class StormBatch:
+    # Membership changes collected during one overload interval
+    def __init__(self):
+        self.joins = {}  # channel -> [nick]
+        self.parts = {}
+        self.quits = {}  # "netsplit a.net b.net" or "" -> [nick]
+        self.modes = {}  # channel -> number of MODE lines
+        self.events = []  # (channel or None for QUIT, nick, joined) in arrival order
+
+    def __bool__(self):
+        return bool(self.events or self.modes)
+
+    def add(self, msg):
+        nick = msg.nick or ""
+        if msg.command == "JOIN" and msg.params:
+            channel = msg.params[0]
+            self.joins.setdefault(channel, []).append(nick)
+            self.events.append((channel, nick, True))
+        elif msg.command == "PART" and msg.params:
+            channel = msg.params[0]
+            self.parts.setdefault(channel, []).append(nick)
+            self.events.append((channel, nick, False))
+        elif msg.command == "QUIT":
+            split = _NETSPLIT.match(msg.text if msg.params else "")
+            reason = f"netsplit {split.group(1)} {split.group(2)}" if split else ""
+            self.quits.setdefault(reason, []).append(nick)
+            self.events.append((None, nick, False))
+        elif msg.command == "MODE" and msg.params:
+            self.modes[msg.params[0]] = self.modes.get(msg.params[0], 0) + 1
+
+    def summary(self):
+        lines = []
+        for reason, nicks in self.quits.items():
+            lines.append(f"*** {len(nicks)} users quit" + (f" ({reason})" if reason else "")
+                         + f": {_nick_list(nicks)}")
+        for channel, nicks in self.joins.items():
+            lines.append(f"*** {len(nicks)} users joined {channel}: {_nick_list(nicks)}")
+        for channel, nicks in self.parts.items():
+            lines.append(f"*** {len(nicks)} users left {channel}: {_nick_list(nicks)}")
+        for channel, count in self.modes.items():
+            lines.append(f"*** {count} mode changes in {channel}")
+        return lines
+
+
+class OverloadGuard:
+    # Counts inbound lines; above enter_rate lines/s JOIN/PART/QUIT/MODE lines are
+    # held back and handed to on_flush as one StormBatch per interval. Everything
+    # else, PRIVMSG included, still goes through one line at a time.
+    # With autoflush off nothing runs in the background: the owner calls flush()
+    # every interval and may supply the clock, as replay does with recorded time.
+    def __init__(self, on_flush, on_notice=None, enter_rate=150, exit_rate=None, interval=2.0,
+                 clock=time.monotonic, autoflush=True):
+        self.on_flush = on_flush
+        self.on_notice = on_notice or (lambda text: None)
+        self.enter_rate = enter_rate
+        self.exit_rate = exit_rate if exit_rate is not None else enter_rate / 4
+        self.interval = interval
+        self.clock = clock
+        self.autoflush = autoflush
+        self.active = False
+        self.collapsed = 0
+        self._batch = StormBatch()
+        self._count = 0
+        self._window_start = None  # set by the first line, in the clock's own time
+        self._lock = threading.Lock()
+        self._flushing = False  # from entering overload until the flush that ends it
+        self._flusher = None  # the one _run thread, while there is one
+
+    def absorb(self, line, command, own_nick=None, msg=None):
+        # True when the line was folded into the current batch; msg saves a
+        # second parse when the caller already has one
+        now = self.clock()
+        notice = None
+        with self._lock:
+            if self._window_start is None:
+                self._window_start = now
+            self._count += 1
+            # Switch on as soon as this second's count reaches the threshold
+            if now - self._window_start >= 1.0 or not self.active and self._count >= self.enter_rate:
+                notice = self._check_rate(now)
+            absorbed = self.active and command in STORM_COMMANDS and self._add(msg or parse_message(line), own_nick)
+        # Notices go out after the lock is released; on_notice may be slow
+        if notice:
+            self.on_notice(notice)
+        return absorbed
+
+    def _add(self, msg, own_nick):
+        # Caller holds self._lock
+        if own_nick and msg.nick == own_nick:
+            # Our own joins and parts open and close tabs
+            return False
+        if msg.command == "MODE" and not (msg.target or "").startswith(("#", "&")):
+            return False
+        self._batch.add(msg)
+        self.collapsed += 1
+        return True
+
+    def _check_rate(self, now):
+        # Caller holds self._lock; returns a notice to emit once it is released
+        elapsed = now - self._window_start
+        # Counting over at least a second keeps a short burst from tripping the switch
+        rate = self._count / max(elapsed, 1.0)
+        measured = self._count / max(elapsed, 0.05)
+        self._count = 0
+        self._window_start = now
+        if not self.active and rate >= self.enter_rate:
+            self.active = True
+            if not self._flushing:
+                # Still flushing since the last overload: it just carries on
+                self._flushing = True
+                if self.autoflush and self._flusher is None:
+                    self._flusher = threading.Thread(target=self._run, name="overload", daemon=True)
+                    self._flusher.start()
+                return (f"*** Overload: {measured:.0f} lines/s, collapsing joins, parts, "
+                        f"quits and mode changes every {self.interval:g} s")
+        elif self.active and rate < self.exit_rate:
+            self.active = False
+        return None
+
+    def flush(self):
+        # One interval's work: hand over the batch and end overload mode once
+        # traffic has calmed down. Returns True while overload mode lasts.
+        notice = None
+        with self._lock:
+            now = self.clock()
+            if self._window_start is not None and now - self._window_start >= 1.0:
+                # Traffic may have stopped altogether; nothing else would notice
+                notice = self._check_rate(now)
+            batch, self._batch = self._batch, StormBatch()
+            over = self._flushing and not self.active
+            if over:
+                self._flushing = False
+            flushing = self._flushing
+        if notice:
+            self.on_notice(notice)
+        if batch:
+            self.on_flush(batch)
+        if over:
+            self.on_notice("*** Overload over, showing every line again")
+        return flushing
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.flush():
+                with self._lock:
+                    if not self._flushing:
+                        self._flusher = None
+                        return
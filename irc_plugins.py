@@ -0,0 +1,206 @@
+# Plugins are .py files in the plugins/ directory with a setup(plugins) function:
+#
+#     def setup(plugins):
+#         @plugins.on("privmsg")
+#         def log_urls(event):
+#             if "http" in event.text:
+#                 ...
+#
+# Handlers run on a small worker pool and must not touch Tk widgets. Filters
+# added with plugins.add_filter() run inline on the network thread; returning
+# False from a filter hides the line from the chat view and log.
+import importlib.util
+import os
+import queue
+import threading
+import time
+
+from irc_protocol import parse_message
+
+
+class Event:
+    def __init__(self, name, message=None, **fields):
+        self.name = name
+        self.message = message
+        self.time = time.time()
+        self.__dict__.update(fields)
+
+    def __getattr__(self, attr):
+        # nick, target, text, params, command, raw... come from the parsed line
+        message = self.__dict__.get("message")
+        if message is not None and attr in type(message).__slots__ + ("target", "text"):
+            return getattr(message, attr)
+        return None
+
+
+def event_name(message):
+    return message.command if message.command.isdigit() else message.command.lower()
+
+
+def event_from_line(line, **fields):
+    message = parse_message(line)
+    return Event(event_name(message), message, **fields)
+
+
+class Handler:
+    def __init__(self, event, func):
+        self.event = event
+        self.func = func
+        self.name = getattr(func, "__qualname__", repr(func))
+        self.enabled = True
+        self.disabled_reason = None
+        self.calls = 0
+        self.errors = 0
+        self.dropped = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.strikes = 0
+
+    def describe(self):
+        avg = (self.total_time / self.calls * 1000) if self.calls else 0.0
+        state = "enabled" if self.enabled else f"disabled ({self.disabled_reason})"
+        return (f"{self.name} [{self.event}] {state}: {self.calls} calls, avg {avg:.2f} ms, "
+                f"max {self.max_time * 1000:.2f} ms, {self.errors} errors, {self.dropped} dropped")
+
+
+class PluginManager:
+    def __init__(self, workers=4, backlog=1000, timeout=2.0, slow_threshold=0.25,
+                 max_strikes=5, filter_budget=0.005, on_error=None):
+        self.workers = workers
+        self.timeout = timeout  # a handler running longer than this is disabled
+        self.slow_threshold = slow_threshold  # handler calls slower than this count as strikes
+        self.max_strikes = max_strikes  # consecutive slow calls before auto-disable
+        self.filter_budget = filter_budget  # filters are held to a much tighter limit
+        self.on_error = on_error or (lambda text: None)
+        self.client = None
+        self.handlers = {}  # event name -> [Handler]
+        self.filters = {}
+        self.dropped = 0
+        self._queue = queue.Queue(backlog)
+        self._running = {}  # worker thread -> (Handler, start time)
+        self._retired = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def active(self):
+        return bool(self.handlers or self.filters)
+
+    def on(self, event, func=None):
+        # Usable as plugins.on("join", handler) or as a @plugins.on("join") decorator
+        if func is None:
+            return lambda f: self.on(event, f)
+        self.handlers.setdefault(event, []).append(Handler(event, func))
+        self._start()
+        return func
+
+    def add_filter(self, event, func):
+        self.filters.setdefault(event, []).append(Handler(event, func))
+        return func
+
+    def all_handlers(self):
+        return [h for hs in self.handlers.values() for h in hs] + \
+               [h for hs in self.filters.values() for h in hs]
+
+    def load_directory(self, path):
+        if not os.path.isdir(path):
+            return
+        for filename in sorted(os.listdir(path)):
+            if not filename.endswith(".py") or filename.startswith("_"):
+                continue
+            try:
+                spec = importlib.util.spec_from_file_location(f"irc_plugin_{filename[:-3]}",
+                                                              os.path.join(path, filename))
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                module.setup(self)
+            except Exception as e:
+                self.on_error(f"Plugin {filename} failed to load: {e}")
+
+    def run_filters(self, event):
+        # Synchronous, on the caller's thread; False means drop the line
+        for h in self.filters.get(event.name, []) + self.filters.get("*", []):
+            if not h.enabled:
+                continue
+            start = time.perf_counter()
+            try:
+                result = h.func(event)
+            except Exception as e:
+                h.errors += 1
+                self.on_error(f"Filter {h.name} error: {e}")
+                result = None
+            self._account(h, time.perf_counter() - start, self.filter_budget)
+            if result is False:
+                return False
+        return True
+
+    def dispatch(self, event):
+        for h in self.handlers.get(event.name, []) + self.handlers.get("*", []):
+            if not h.enabled:
+                continue
+            try:
+                self._queue.put_nowait((h, event))
+            except queue.Full:
+                # Never wait for the pool; the reader thread must keep reading
+                h.dropped += 1
+                self.dropped += 1
+
+    def _account(self, h, elapsed, threshold):
+        h.calls += 1
+        h.total_time += elapsed
+        h.max_time = max(h.max_time, elapsed)
+        if elapsed > threshold:
+            h.strikes += 1
+            if h.strikes >= self.max_strikes and h.enabled:
+                self._disable(h, f"{h.strikes} consecutive calls over {threshold * 1000:.0f} ms")
+        else:
+            h.strikes = 0
+
+    def _disable(self, h, reason):
+        h.enabled = False
+        h.disabled_reason = reason
+        self.on_error(f"Plugin handler {h.name} disabled: {reason}")
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.workers):
+            self._spawn_worker()
+        threading.Thread(target=self._watchdog, name="plugin-watchdog", daemon=True).start()
+
+    def _spawn_worker(self):
+        threading.Thread(target=self._worker, name="plugin-worker", daemon=True).start()
+
+    def _worker(self):
+        me = threading.current_thread()
+        while me not in self._retired:
+            h, event = self._queue.get()
+            if not h.enabled:
+                continue
+            start = time.perf_counter()
+            self._running[me] = (h, start)
+            try:
+                h.func(event)
+            except Exception as e:
+                h.errors += 1
+                self.on_error(f"Plugin handler {h.name} error: {e}")
+            finally:
+                self._running.pop(me, None)
+            self._account(h, time.perf_counter() - start, self.slow_threshold)
+        self._retired.discard(me)
+
+    def _watchdog(self):
+        # Threads cannot be killed, so a hung handler is disabled and its worker
+        # replaced; the stuck thread exits on its own if the call ever returns
+        while True:
+            time.sleep(self.timeout / 4)
+            now = time.perf_counter()
+            for thread, (h, start) in list(self._running.items()):
+                if thread in self._retired or now - start <= self.timeout:
+                    continue
+                self._retired.add(thread)
+                if h.enabled:
+                    self._disable(h, f"timed out after {self.timeout:.1f} s")
+                self._spawn_worker()
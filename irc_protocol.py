@@ -0,0 +1,46 @@
+class IRCMessage:
+    __slots__ = ("raw", "tags", "prefix", "nick", "command", "params")
+
+    def __init__(self, raw, tags, prefix, command, params):
+        self.raw = raw
+        self.tags = tags
+        self.prefix = prefix
+        self.nick = prefix.split('!', 1)[0] if prefix else None
+        self.command = command
+        self.params = params
+
+    @property
+    def target(self):
+        return self.params[0] if self.params else None
+
+    @property
+    def text(self):
+        return self.params[-1] if self.params else ""
+
+    def __repr__(self):
+        return f"IRCMessage({self.raw!r})"
+
+
+def parse_message(line):
+    # [@tags] [:prefix] COMMAND [params...] [:trailing]
+    tags = {}
+    prefix = None
+    rest = line
+    if rest.startswith('@'):
+        raw_tags, _, rest = rest[1:].partition(' ')
+        for tag in raw_tags.split(';'):
+            key, _, value = tag.partition('=')
+            tags[key] = value
+        rest = rest.lstrip(' ')
+    if rest.startswith(':'):
+        prefix, _, rest = rest[1:].partition(' ')
+        rest = rest.lstrip(' ')
+    if ' :' in rest:
+        rest, trailing = rest.split(' :', 1)
+        params = rest.split()
+        command = params.pop(0).upper() if params else ""
+        params.append(trailing)
+    else:
+        params = rest.split()
+        command = params.pop(0).upper() if params else ""
+    return IRCMessage(line, tags, prefix, command, params)
@@ -0,0 +1,238 @@
+import argparse
+import gzip
+import json
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"IRCREC1\n"
+INBOUND = b"<"
+OUTBOUND = b">"
+# microseconds since recording start, direction, line length; then the raw line
+RECORD = struct.Struct("<QcH")
+
+
+def _open(path, mode):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+class TrafficRecorder:
+    def __init__(self, path, header=None):
+        self.path = path
+        self.lines = 0
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._file = _open(path, "wb")
+        meta = json.dumps(dict(header or {}, started=time.time())).encode("utf-8")
+        self._file.write(MAGIC + struct.pack("<I", len(meta)) + meta)
+
+    def write(self, direction, raw):
+        raw = raw[:0xffff]
+        stamp = int((time.monotonic() - self._start) * 1000000)
+        with self._lock:
+            if self._file:
+                self._file.write(RECORD.pack(stamp, direction, len(raw)) + raw)
+                self.lines += 1
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class RecordingSocket:
+    # Wraps the client socket so every outbound line is recorded, whichever
+    # part of the client sent it
+    def __init__(self, sock, recorder):
+        self.sock = sock
+        self.recorder = recorder
+
+    def _record(self, data):
+        for raw in bytes(data).split(b"\n"):
+            raw = raw.rstrip(b"\r")
+            if raw:
+                self.recorder.write(OUTBOUND, raw)
+
+    def send(self, data, *args):
+        sent = self.sock.send(data, *args)
+        self._record(data[:sent])
+        return sent
+
+    def sendall(self, data, *args):
+        self.sock.sendall(data, *args)
+        self._record(data)
+
+    def __getattr__(self, attr):
+        return getattr(self.sock, attr)
+
+
+class NullSocket:
+    # Replay never touches the network; anything the client sends is counted
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, data, *args):
+        self.sent += 1
+        return len(data)
+
+    def sendall(self, data, *args):
+        self.sent += 1
+
+    def getsockname(self):
+        return ("127.0.0.1", 0)
+
+    def close(self):
+        pass
+
+
+def read_recording(path):
+    # Returns (header, iterator of (seconds, direction, raw line))
+    f = _open(path, "rb")
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError(f"{path} is not a traffic recording")
+    size = struct.unpack("<I", f.read(4))[0]
+    header = json.loads(f.read(size).decode("utf-8"))
+
+    def records():
+        with f:
+            while True:
+                head = f.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    return
+                stamp, direction, length = RECORD.unpack(head)
+                yield stamp / 1000000, direction, f.read(length)
+    return header, records()
+
+
+class ReplayStats:
+    def __init__(self, stall_threshold):
+        self.stall_threshold = stall_threshold
+        self.lines = 0
+        self.durations = []
+        self.stalls = []  # (seconds, line) for lines slower than the threshold
+        self.max_lag = 0.0
+        self.elapsed = 0.0
+
+    def add(self, duration, line):
+        self.lines += 1
+        self.durations.append(duration)
+        if duration > self.stall_threshold:
+            self.stalls.append((duration, line))
+
+    def report(self):
+        durations = sorted(self.durations)
+        def pct(p):
+            return durations[min(len(durations) - 1, int(len(durations) * p))] * 1000 if durations else 0.0
+        rate = self.lines / self.elapsed if self.elapsed else 0.0
+        out = [f"{self.lines} lines in {self.elapsed:.3f} s ({rate:.0f} lines/s)",
+               f"per line: p50 {pct(0.5):.3f} ms, p99 {pct(0.99):.3f} ms, max {pct(1.0):.3f} ms",
+               f"stalls over {self.stall_threshold * 1000:.0f} ms: {len(self.stalls)}"]
+        if self.max_lag:
+            out.append(f"max lag behind recorded timing: {self.max_lag * 1000:.1f} ms")
+        for duration, line in sorted(self.stalls, reverse=True)[:5]:
+            out.append(f"  {duration * 1000:.1f} ms  {line[:100]}")
+        return "\n".join(out)
+
+
+def replay(path, client, realtime=False, speed=1.0, stall_threshold=0.05, pump=None):
+    # Feed recorded inbound lines through client._handle_line; pump() (e.g. a Tk
+    # update) runs after each line and is included in its timing
+    _, records = read_recording(path)
+    client.sock = NullSocket()
+    stats = ReplayStats(stall_threshold)
+    # Overload detection runs on recorded time and flushes inline, so a storm
+    # collapses the same way at any replay speed
+    overload = client.overload
+    clock = [0.0]
+    overload.clock = lambda: clock[0]
+    overload.autoflush = False
+    next_flush = overload.interval
+    start = time.perf_counter()
+    for stamp, direction, raw in records:
+        if direction != INBOUND:
+            continue
+        if realtime:
+            due = start + stamp / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                stats.max_lag = max(stats.max_lag, -delay)
+        line = raw.decode("utf-8", errors="ignore")
+        t0 = time.perf_counter()
+        while next_flush <= stamp:
+            clock[0] = next_flush
+            overload.flush()
+            next_flush += overload.interval
+        clock[0] = stamp
+        client._handle_line(line)
+        if pump:
+            pump()
+        stats.add(time.perf_counter() - t0, line)
+    # Let a storm that lasted to the end of the recording wind down
+    while True:
+        clock[0] = next_flush
+        next_flush += overload.interval
+        if not overload.flush():
+            break
+    if pump:
+        pump()
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def main():
+    from irc_client import PLUGIN_DIR, HeadlessGui, IRCClient, IRCGui, load_settings
+    from irc_plugins import PluginManager
+    from irc_diagnostics import Diagnostics, install_signal_handlers
+
+    parser = argparse.ArgumentParser(description="Replay a recorded IRC session through the client")
+    parser.add_argument("recording")
+    parser.add_argument("--realtime", action="store_true", help="keep the recorded timing")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale for --realtime")
+    parser.add_argument("--headless", action="store_true", help="parse and route without Tk rendering")
+    parser.add_argument("--stall-ms", type=float, default=50.0)
+    parser.add_argument("--profile", choices=("sampling", "cprofile"),
+                        help="profile the replay and write a report to --diag-dir")
+    parser.add_argument("--trace-memory", action="store_true", help="write a tracemalloc report after the replay")
+    parser.add_argument("--diag-dir", help="where reports go (default: diagnostics/)")
+    args = parser.parse_args()
+
+    header, _ = read_recording(args.recording)
+    root = None
+    if args.headless:
+        plugins = PluginManager(on_error=print)
+        plugins.load_directory(PLUGIN_DIR)
+        gui = HeadlessGui(settings=load_settings(), plugins=plugins)
+    else:
+        import tkinter as tk
+        root = tk.Tk()
+        gui = IRCGui(root)
+    # Same settings, plugins and overload thresholds as a live client; always
+    # in-process, since replay feeds lines straight to _handle_line
+    client = gui._new_client(header.get("server", "replay"), header.get("port", 0),
+                             header.get("nickname", "replay"), None, client_class=IRCClient)
+    gui.client = client
+    client.auto_reconnect = False
+    client.log_file = os.devnull
+    diagnostics = Diagnostics(args.diag_dir)
+    install_signal_handlers(diagnostics)
+    if args.trace_memory:
+        diagnostics.start_trace()
+    if args.profile:
+        diagnostics.start_profile(args.profile)
+    stats = replay(args.recording, client, realtime=args.realtime, speed=args.speed,
+                   stall_threshold=args.stall_ms / 1000, pump=root.update if root else None)
+    print(stats.report())
+    for path in diagnostics.stop_profile() + [diagnostics.stop_trace()]:
+        if path:
+            print(f"wrote {path}")
+    if root:
+        root.destroy()
+
+
+if __name__ == "__main__":
+    main()
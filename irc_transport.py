@@ -0,0 +1,140 @@
+import errno
+import os
+import selectors
+import socket
+import threading
+import time
+
+
+def enable_keepalive(sock, idle=10, interval=5, count=3):
+    # Let the kernel probe an idle connection so a silently dropped link errors out
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+    elif hasattr(socket, "TCP_KEEPALIVE"):  # macOS spells the idle option differently
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+    elif hasattr(socket, "SIO_KEEPALIVE_VALS"):
+        sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle * 1000, interval * 1000))
+
+
+class AddressCache:
+    # getaddrinfo() results per (host, port), reused for `ttl` seconds so a
+    # reconnect does not wait on DNS. The stdlib resolver does not expose record
+    # TTLs, so one fixed lifetime applies; a failed connect drops the entry early.
+    def __init__(self, ttl=300, resolver=socket.getaddrinfo):
+        self.ttl = ttl
+        self.resolver = resolver
+        self.lookups = 0
+        self._entries = {}  # (host, port) -> (expires, [(family, sockaddr)])
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        key = (host, port)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        self.lookups += 1
+        infos = self.resolver(host, port, 0, socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys((info[0], info[4]) for info in infos))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def prefer(self, host, port, peer):
+        # Try the address that worked last time first on the next connect
+        with self._lock:
+            entry = self._entries.get((host, port))
+            if entry:
+                addresses = sorted(entry[1], key=lambda a: a[1][:2] != peer[:2])
+                self._entries[(host, port)] = (entry[0], addresses)
+
+    def invalidate(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+DNS_CACHE = AddressCache()
+
+
+def interleave(addresses):
+    # RFC 8305 ordering: keep the resolver's preference but alternate families,
+    # so one broken family costs a single attempt delay rather than all of them
+    by_family = {}
+    for family, sockaddr in addresses:
+        by_family.setdefault(family, []).append((family, sockaddr))
+    queues = list(by_family.values())
+    ordered = []
+    while queues:
+        for q in list(queues):
+            ordered.append(q.pop(0))
+            if not q:
+                queues.remove(q)
+    return ordered
+
+
+def connect_racing(addresses, delay=0.25, timeout=30):
+    # Happy Eyeballs: start the next attempt every `delay` seconds, or at once
+    # when an attempt fails; the first connection to complete wins
+    if not addresses:
+        raise OSError("no addresses to connect to")
+    pending = list(interleave(addresses))
+    selector = selectors.DefaultSelector()
+    errors = []
+    deadline = time.monotonic() + timeout
+    next_start = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            if pending and (now >= next_start or not selector.get_map()):
+                family, sockaddr = pending.pop(0)
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                err = sock.connect_ex(sockaddr)
+                if err in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", -1)):
+                    selector.register(sock, selectors.EVENT_WRITE, sockaddr)
+                    next_start = now + delay
+                else:
+                    errors.append(f"{sockaddr[0]}: {os.strerror(err)}")
+                    sock.close()
+                    next_start = now  # a failed attempt hands over at once
+                continue
+            if not selector.get_map():
+                raise OSError("all connection attempts failed: " + "; ".join(errors))
+            if now >= deadline:
+                raise socket.timeout(f"connection timed out after {timeout} s")
+            wait = deadline - now
+            if pending:
+                wait = min(wait, max(0.0, next_start - now))
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                selector.unregister(sock)
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err:
+                    errors.append(f"{key.data[0]}: {os.strerror(err)}")
+                    sock.close()
+                    next_start = time.monotonic()
+                    continue
+                sock.setblocking(True)
+                return sock
+    finally:
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+
+
+def open_connection(host, port, cache=DNS_CACHE, delay=0.25, timeout=30):
+    # Resolve (cached) every A/AAAA address, race them, and tune the winner for
+    # an interactive line protocol
+    try:
+        sock = connect_racing(cache.resolve(host, port), delay=delay, timeout=timeout)
+    except OSError:
+        # The addresses may have moved; resolve again next time
+        cache.invalidate(host, port)
+        raise
+    cache.prefer(host, port, sock.getpeername())
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    enable_keepalive(sock)
+    return sock
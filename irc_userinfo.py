@@ -0,0 +1,412 @@
+import threading
+import time
+from collections import deque
+
+# RFC 1459 case mapping: {}|^ are the lower-case forms of []\~
+_CASEMAP = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ[]\\~", "abcdefghijklmnopqrstuvwxyz{}|^")
+WHOIS_NUMERICS = {"301", "311", "312", "313", "317", "318", "319", "330", "338", "378", "671"}
+WHO_NUMERICS = {"352", "315"}
+USERHOST_REPLY = "302"
+NO_SUCH_NICK = "401"
+USERHOST_MAX = 5  # nicks per USERHOST line (RFC 1459)
+# Every reply UserInfoCache.handle() may take
+USERINFO_NUMERICS = WHOIS_NUMERICS | WHO_NUMERICS | {USERHOST_REPLY, NO_SUCH_NICK}
+
+
+def irc_casefold(nick):
+    return nick.translate(_CASEMAP)
+
+
+class UserInfo:
+    def __init__(self, nick):
+        self.nick = nick
+        self.user = None
+        self.host = None
+        self.realname = None
+        self.server = None
+        self.server_info = None
+        self.account = None
+        self.away = None
+        self.idle = None
+        self.signon = None
+        self.channels = []
+        self.fetched = time.monotonic()
+        self.complete = False  # True once a full WHOIS (318) has been seen
+        self.missing = False  # 401: no such nick
+
+    @property
+    def hostmask(self):
+        if self.user and self.host:
+            return f"{self.nick}!{self.user}@{self.host}"
+        return self.nick
+
+    def fields(self):
+        rows = [("Nick", self.nick), ("User", self.user), ("Host", self.host),
+                ("Real name", self.realname), ("Server", self.server), ("Account", self.account),
+                ("Away", self.away)]
+        if self.idle is not None:
+            rows.append(("Idle", f"{self.idle // 3600}h {self.idle % 3600 // 60}m {self.idle % 60}s"))
+        if self.signon:
+            rows.append(("Signed on", time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.signon))))
+        if self.channels:
+            rows.append(("Channels", " ".join(self.channels)))
+        return [(label, value) for label, value in rows if value]
+
+    def to_dict(self):
+        # For passing between processes; fetched is local to each side
+        return {name: getattr(self, name) for name in _USERINFO_FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        info = cls(data["nick"])
+        for name in _USERINFO_FIELDS[1:]:
+            setattr(info, name, data.get(name))
+        info.channels = info.channels or []
+        return info
+
+
+_USERINFO_FIELDS = ("nick", "user", "host", "realname", "server", "server_info", "account", "away",
+                    "idle", "signon", "channels", "complete", "missing")
+
+
+class _WhoBatch:
+    def __init__(self, nicks, callback):
+        self.nicks = list(nicks)
+        self.keys = {irc_casefold(n) for n in nicks}
+        self.callback = callback
+        self.masks = set()  # keys of the WHO and USERHOST queries this batch is waiting on
+        self.sent = False
+        self.started = time.monotonic()
+
+
+class UserInfoCache:
+    def __init__(self, send_raw, ttl=300, rate=0.5, burst=3, batch_delay=0.3,
+                 channel_threshold=10, query_timeout=30):
+        self.send_raw = send_raw
+        self.ttl = ttl
+        self.rate = rate  # lookup queries per second once the burst is spent
+        self.burst = burst
+        self.batch_delay = batch_delay  # gather lookups for this long before sending queries
+        self.channel_threshold = channel_threshold  # more misses than this: WHO #channel instead of USERHOST
+        self.query_timeout = query_timeout  # unanswered lookups are given up after this long
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self._users = {}  # case-folded nick -> UserInfo
+        self._partial = {}  # WHOIS replies still being collected
+        self._whois_waiters = {}  # case-folded nick -> [callback]
+        self._whois_started = {}  # case-folded nick -> when its WHOIS was queued
+        self._who_pending = []  # (nick, channel) waiting to be batched
+        self._batches = []
+        self._queries = {}  # key of a WHO #channel or USERHOST we sent -> when it was queued
+        self._userhost = deque()  # (key, case-folded nicks) in send order; 302 replies come back in it
+        self._send_queue = []
+        self._tokens = burst
+        self._refill = time.monotonic()
+        self._cond = threading.Condition()
+        self._worker = None
+
+    # Cache
+
+    def get(self, nick, complete=False):
+        info = self._users.get(irc_casefold(nick))
+        if info is None or time.monotonic() - info.fetched > self.ttl:
+            return None
+        if complete and not info.complete:
+            return None
+        return info
+
+    def invalidate(self, nick):
+        self._users.pop(irc_casefold(nick), None)
+
+    def clear(self):
+        self._users.clear()
+
+    def reset(self):
+        # The connection went away: nothing in flight will be answered
+        with self._cond:
+            self._whois_waiters.clear()
+            self._whois_started.clear()
+            self._partial.clear()
+            self._who_pending = []
+            self._send_queue = []
+            self._queries.clear()
+            self._userhost.clear()
+            batches, self._batches = self._batches, []
+        for batch in batches:
+            batch.callback({irc_casefold(n): self.get(n) for n in batch.nicks})
+
+    def _expire(self):
+        # Caller holds self._cond; returns WHO batches to complete outside the lock
+        now = time.monotonic()
+        for key, started in list(self._whois_started.items()):
+            if now - started > self.query_timeout:
+                self._whois_waiters.pop(key, None)
+                self._whois_started.pop(key, None)
+                self._partial.pop(key, None)
+        done = []
+        for key, started in list(self._queries.items()):
+            if now - started > self.query_timeout:
+                done.extend(self._end_query_locked(key))
+        return done + [b for b in self._batches if b.sent and now - b.started > self.query_timeout]
+
+    # Lookups
+
+    def whois(self, nick, callback):
+        # Returns True when served from cache (callback already called)
+        info = self.get(nick, complete=True)
+        if info:
+            self.hits += 1
+            callback(info)
+            return True
+        self.misses += 1
+        key = irc_casefold(nick)
+        with self._cond:
+            expired = self._expire()
+            waiters = self._whois_waiters.setdefault(key, [])
+            waiters.append(callback)
+            if len(waiters) == 1:
+                self._whois_started[key] = time.monotonic()
+                self._queue(f"WHOIS {nick}")
+        self._complete(expired)
+        return False
+
+    def lookup_many(self, nicks, callback=None, channel=None):
+        # Resolve user@host for many nicks with as few queries as possible.
+        # callback(dict of case-folded nick -> UserInfo or None) once every nick is settled.
+        missing = []
+        for nick in nicks:
+            if self.get(nick):
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.append(nick)
+        if not missing:
+            if callback:
+                callback({irc_casefold(n): self.get(n) for n in nicks})
+            return True
+        with self._cond:
+            expired = self._expire()
+            if callback:
+                self._batches.append(_WhoBatch(nicks, callback))
+            self._who_pending.extend((n, channel) for n in missing)
+            if len(self._who_pending) == len(missing):
+                # First lookups in this window; give hover and friends time to pile up
+                timer = threading.Timer(self.batch_delay, self._flush_who)
+                timer.daemon = True
+                timer.start()
+        self._complete(expired)
+        return False
+
+    def _flush_who(self):
+        with self._cond:
+            pending, self._who_pending = self._who_pending, []
+            if not pending:
+                return
+            # WHO takes a single mask on most servers, so many nicks from one
+            # channel become WHO #channel and the rest go five to a USERHOST
+            lines = []
+            by_channel = {}
+            for nick, channel in pending:
+                by_channel.setdefault(channel, []).append(nick)
+            singles = []
+            for channel, nicks in by_channel.items():
+                if channel and len(nicks) > self.channel_threshold:
+                    lines.append((irc_casefold(channel), f"WHO {channel}"))
+                else:
+                    singles.extend(nicks)
+            singles = list({irc_casefold(n): n for n in singles}.values())
+            for i in range(0, len(singles), USERHOST_MAX):
+                chunk = singles[i:i + USERHOST_MAX]
+                line = "USERHOST " + " ".join(chunk)
+                key = irc_casefold(line)
+                self._userhost.append((key, {irc_casefold(n) for n in chunk}))
+                lines.append((key, line))
+            now = time.monotonic()
+            for key, _ in lines:
+                self._queries[key] = now
+            for batch in self._batches:
+                if not batch.sent:
+                    batch.masks = {key for key, _ in lines}
+                    batch.sent = True
+            for _, line in lines:
+                self._queue(line)
+
+    # Flood-limited sending
+
+    def _queue(self, line):
+        # Caller holds self._cond
+        self._send_queue.append(line)
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._send_loop, name="userinfo", daemon=True)
+            self._worker.start()
+        self._cond.notify()
+
+    def _send_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    self._tokens = min(self.burst, self._tokens + (now - self._refill) * self.rate)
+                    self._refill = now
+                    if self._send_queue and self._tokens >= 1:
+                        break
+                    wait = None if not self._send_queue else (1 - self._tokens) / self.rate
+                    self._cond.wait(wait)
+                self._tokens -= 1
+                line = self._send_queue.pop(0)
+            try:
+                self.queries += 1
+                self.send_raw(line)
+            except Exception:
+                if line.startswith("WHOIS "):
+                    # Nobody will answer; let the next whois() for this nick send again
+                    key = irc_casefold(line[6:])
+                    with self._cond:
+                        self._whois_waiters.pop(key, None)
+                        self._whois_started.pop(key, None)
+                else:
+                    self._end_query(irc_casefold(line[4:] if line.startswith("WHO ") else line))
+
+    # Replies
+
+    def handle(self, msg):
+        # Feed a parsed numeric; returns True if it belonged to a lookup
+        command, params = msg.command, msg.params
+        if command in WHOIS_NUMERICS and len(params) >= 2:
+            # 301 also answers a PRIVMSG to someone away; only WHOIS we sent is ours
+            if irc_casefold(params[1]) not in self._whois_waiters:
+                return False
+            self._handle_whois(command, params)
+            return True
+        # WHO replies are only ours while a WHO #channel we sent is open;
+        # anything else is the user's own /who and belongs in the chat
+        if command == "352" and len(params) >= 8 and irc_casefold(params[1]) in self._queries:
+            info = self._store(params[5])
+            info.user, info.host, info.server = params[2], params[3], params[4]
+            info.realname = params[7].split(" ", 1)[1] if " " in params[7] else params[7]
+            self._settle(irc_casefold(params[5]))
+            return True
+        if command == "315" and len(params) >= 2 and irc_casefold(params[1]) in self._queries:
+            self._end_query(irc_casefold(params[1]))
+            return True
+        if command == USERHOST_REPLY and params and self._userhost:
+            return self._handle_userhost(params[-1])
+        if command == NO_SUCH_NICK and len(params) >= 2:
+            key = irc_casefold(params[1])
+            if key in self._whois_waiters:
+                # Answer now; the 318 that follows clears the partial entry without caching it
+                info = self._partial.setdefault(key, UserInfo(params[1]))
+                info.missing = True
+                self._finish_whois(key, info)
+                return True
+        return False
+
+    def _handle_whois(self, command, params):
+        nick = params[1]
+        key = irc_casefold(nick)
+        info = self._partial.get(key)
+        if info is None:
+            info = self._partial[key] = UserInfo(nick)
+        if command == "311" and len(params) >= 6:
+            info.user, info.host, info.realname = params[2], params[3], params[5]
+        elif command == "312" and len(params) >= 4:
+            info.server, info.server_info = params[2], params[3]
+        elif command == "317" and len(params) >= 3:
+            info.idle = int(params[2]) if params[2].isdigit() else None
+            if len(params) >= 5 and params[3].isdigit():
+                info.signon = int(params[3])
+        elif command == "319":
+            info.channels.extend(params[-1].split())
+        elif command == "330" and len(params) >= 3:
+            info.account = params[2]
+        elif command == "301":
+            info.away = params[-1]
+        elif command == "318":
+            self._partial.pop(key, None)
+            if info.missing:
+                return
+            info.complete = True
+            info.fetched = time.monotonic()
+            self._users[key] = info
+            self._finish_whois(key, info)
+
+    def _finish_whois(self, key, info):
+        with self._cond:
+            waiters = self._whois_waiters.pop(key, [])
+            self._whois_started.pop(key, None)
+        for callback in waiters:
+            callback(info)
+
+    def _store(self, nick):
+        key = irc_casefold(nick)
+        info = self._users.get(key)
+        if info is None or info.complete and time.monotonic() - info.fetched > self.ttl:
+            info = self._users[key] = UserInfo(nick)
+        info.fetched = time.monotonic()
+        return info
+
+    def _settle(self, key):
+        with self._cond:
+            done = []
+            for batch in self._batches:
+                batch.keys.discard(key)
+                if not batch.keys:
+                    done.append(batch)
+        self._complete(done)
+
+    def _handle_userhost(self, text):
+        # "nick*=+user@host nick2=-user@host": * marks an oper, - away; nicks
+        # that do not exist are left out
+        replies = {}
+        for item in text.split():
+            name, _, rest = item.partition("=")
+            user, _, host = rest[1:].partition("@")
+            replies[irc_casefold(name.rstrip("*"))] = (name.rstrip("*"), user, host)
+        with self._cond:
+            if not self._userhost or not set(replies) <= self._userhost[0][1]:
+                # Not an answer to our oldest USERHOST: the user sent one themselves
+                return False
+            key, _ = self._userhost[0]
+        for nick, user, host in replies.values():
+            info = self._store(nick)
+            info.user, info.host = user, host
+        self._end_query(key)
+        return True
+
+    def _end_query(self, key):
+        with self._cond:
+            done = self._end_query_locked(key)
+        self._complete(done)
+
+    def _end_query_locked(self, key):
+        # Caller holds self._cond; returns the batches this query was the last one of
+        self._queries.pop(key, None)
+        for i, (pending, _) in enumerate(self._userhost):
+            if pending == key:
+                del self._userhost[i]
+                break
+        done = []
+        for batch in self._batches:
+            batch.masks.discard(key)
+            if batch.sent and not batch.masks:
+                # Whatever is still unresolved after all its queries ended does not exist
+                done.append(batch)
+        return done
+
+    def _complete(self, batches):
+        for batch in batches:
+            with self._cond:
+                if batch not in self._batches:
+                    continue
+                self._batches.remove(batch)
+            batch.callback({irc_casefold(n): self.get(n) for n in batch.nicks})
+
+    # Membership changes
+
+    def handle_nick(self, old, new):
+        self.invalidate(old)
+        self.invalidate(new)
+
+    def handle_quit(self, nick):
+        self.invalidate(nick)
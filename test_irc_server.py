@@ -1,5 +1,6 @@
 import socket
 import threading
+import time
 
 class TestIRCServer:
     def __init__(self, host='127.0.0.1', port=6667):
@@ -7,6 +8,7 @@ class TestIRCServer:
         self.port = port
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.clients = []
+        self.nicks = {}
         self.running = True
         # Add fake users for testing
         self.channels = {
@@ -15,14 +17,19 @@ class TestIRCServer:
             '#help': [f'helper{i}' for i in range(1, 11)]
         }
 
-    def start(self):
+    def start_background(self):
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen(5)
+        # Port 0 picks a free port; report the real one
+        self.port = self.server_socket.getsockname()[1]
         print(f"Test IRC server running on {self.host}:{self.port}")
         threading.Thread(target=self.accept_clients, daemon=True).start()
+
+    def start(self):
+        self.start_background()
         try:
             while self.running:
-                pass
+                time.sleep(0.5)
         except KeyboardInterrupt:
             self.running = False
             self.server_socket.close()
@@ -31,6 +38,9 @@ class TestIRCServer:
     def accept_clients(self):
         while self.running:
             client_sock, addr = self.server_socket.accept()
+            # Replies go out as several small send()s; without this Nagle holds each
+            # one back for the client's delayed ACK and every command costs ~40 ms
+            client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             print(f"Client connected from {addr}")
             self.clients.append(client_sock)
             threading.Thread(target=self.handle_client, args=(client_sock,), daemon=True).start()
@@ -38,27 +48,34 @@ class TestIRCServer:
     def handle_client(self, client_sock):
         nickname = None
         channel = None
+        buffer = ''
         while self.running:
             try:
                 data = client_sock.recv(2048).decode('utf-8', errors='ignore')
-                for line in data.split('\r\n'):
+                if not data:
+                    break
+                # Lines may be split across reads, keep the partial tail
+                *lines, buffer = (buffer + data).split('\r\n')
+                for line in lines:
                     if line:
                         print(f"Received: {line}")
                         if line.startswith('NICK'):
                             nickname = line.split()[1]
+                            self.nicks[nickname] = client_sock
                             client_sock.send(f":server 001 {nickname} :Welcome to the Test IRC Server\r\n".encode('utf-8'))
-                        elif line.startswith('USER'):
+                        elif line.startswith('USER '):
                             pass  # Ignore for simplicity
                         elif line.startswith('JOIN'):
-                            channel = line.split()[1]
-                            if channel not in self.channels:
-                                self.channels[channel] = []
-                            self.channels[channel].append(nickname)
-                            client_sock.send(f":{nickname}!user@localhost JOIN {channel}\r\n".encode('utf-8'))
-                            # Send NAMES reply
-                            names = ' '.join(self.channels[channel])
-                            client_sock.send(f":server 353 {nickname} = {channel} :{names}\r\n".encode('utf-8'))
-                            client_sock.send(f":server 366 {nickname} {channel} :End of /NAMES list.\r\n".encode('utf-8'))
+                            # JOIN #a,#b,#c [key1,key2]; keys are accepted but not checked
+                            for channel in line.split()[1].split(','):
+                                if channel not in self.channels:
+                                    self.channels[channel] = []
+                                self.channels[channel].append(nickname)
+                                client_sock.send(f":{nickname}!user@localhost JOIN {channel}\r\n".encode('utf-8'))
+                                # Send NAMES reply
+                                names = ' '.join(self.channels[channel])
+                                client_sock.send(f":server 353 {nickname} = {channel} :{names}\r\n".encode('utf-8'))
+                                client_sock.send(f":server 366 {nickname} {channel} :End of /NAMES list.\r\n".encode('utf-8'))
                         elif line.startswith('PRIVMSG'):
                             parts = line.split(' ', 2)
                             if len(parts) == 3:
@@ -72,11 +89,43 @@ class TestIRCServer:
                                                 sock.send(f":{nickname} {target} :{msg}\r\n".encode('utf-8'))
                                             except Exception:
                                                 pass
+                                elif target in self.nicks:
+                                    # Private message to a connected user (also carries DCC CTCPs)
+                                    self.nicks[target].send(f":{nickname}!user@localhost PRIVMSG {target} :{msg}\r\n".encode('utf-8'))
                                 else:
                                     # Private message, echo to sender only
                                     client_sock.send(f":{nickname} PRIVMSG {target} :{msg}\r\n".encode('utf-8'))
                         elif line.startswith('PING'):
                             client_sock.send(f"PONG {line.split()[1]}\r\n".encode('utf-8'))
+                        elif line.startswith('WHOIS'):
+                            target = line.split()[1]
+                            if target in self.nicks or any(target in users for users in self.channels.values()):
+                                chans = ' '.join(ch for ch, users in self.channels.items() if target in users)
+                                client_sock.send(f":server 311 {nickname} {target} {target} localhost * :Test User {target}\r\n".encode('utf-8'))
+                                client_sock.send(f":server 319 {nickname} {target} :{chans}\r\n".encode('utf-8'))
+                                client_sock.send(f":server 312 {nickname} {target} server :Test IRC Server\r\n".encode('utf-8'))
+                                client_sock.send(f":server 317 {nickname} {target} 42 1700000000 :seconds idle, signon time\r\n".encode('utf-8'))
+                            else:
+                                client_sock.send(f":server 401 {nickname} {target} :No such nick/channel\r\n".encode('utf-8'))
+                            client_sock.send(f":server 318 {nickname} {target} :End of /WHOIS list.\r\n".encode('utf-8'))
+                        elif line.startswith('USERHOST'):
+                            # Up to five nicks, one 302 reply listing those that exist
+                            found = [n for n in line.split()[1:6]
+                                     if n in self.nicks or any(n in users for users in self.channels.values())]
+                            replies = ' '.join(f"{n}=+{n}@host-{n}.localhost" for n in found)
+                            client_sock.send(f":server 302 {nickname} :{replies}\r\n".encode('utf-8'))
+                        elif line.startswith('WHO'):
+                            # WHO #channel or WHO nick
+                            mask = line.split()[1]
+                            if mask in self.channels:
+                                found = [(mask, u) for u in self.channels[mask]]
+                            elif mask in self.nicks or any(mask in users for users in self.channels.values()):
+                                found = [(next((ch for ch, users in self.channels.items() if mask in users), '*'), mask)]
+                            else:
+                                found = []
+                            for ch, n in found:
+                                client_sock.send(f":server 352 {nickname} {ch} {n} host-{n}.localhost server {n} H :0 Test User {n}\r\n".encode('utf-8'))
+                            client_sock.send(f":server 315 {nickname} {mask} :End of /WHO list.\r\n".encode('utf-8'))
                         elif line.startswith('LIST'):
                             # Send channel list
                             for ch in self.channels: